@@ -14,3 +14,5 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+default_app_config = 'library.apps.LibraryConfig'
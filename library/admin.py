@@ -20,7 +20,12 @@
 from django.contrib import admin
 from django.utils.translation import ugettext_lazy as _
 from library.models import Lendable
+from library.models import LendableArchive
 from library.models import FrontpageMessage
+from library.models import LendableInventory
+from library.models import PooledIAMUser
+from library.models import WaitlistEntry
+from library.models import WarmPoolMetrics
 
 from simple_history.admin import SimpleHistoryAdmin
 
@@ -51,13 +56,16 @@ class LendableAdmin(admin.ModelAdmin):
 
     list_filter = (CheckoutFilter,)
     list_display = ('pk', '__str__')
+    exclude = ('pending_credentials',)
     readonly_fields = (
         'checked_in_on',
         'checked_out_on',
         'type',
         'user',
         'username',
-        'notify_timer'
+        'notify_timer',
+        'state',
+        'account'
     )
 
     def get_queryset(self, request):
@@ -70,6 +78,27 @@ class LendableAdmin(admin.ModelAdmin):
         return query_set
 
 
+class LendableArchiveAdmin(admin.ModelAdmin):
+    """Read only display of archived lendables."""
+
+    list_display = ('lendable_id', '__str__', 'checked_in_on', 'account')
+    list_filter = ('type', 'state', 'account')
+    search_fields = ('username', 'user__username', 'user__email')
+    date_hierarchy = 'checked_in_on'
+
+    def get_readonly_fields(self, request, obj=None):
+        """Every field is read only."""
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        """Lendables are only archived by archive_lendables."""
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        """Archived lendables are kept."""
+        return False
+
+
 class FrontpageMessageAdmin(SimpleHistoryAdmin):
     """List frontpage messages by rank and title"""
 
@@ -77,5 +106,47 @@ class FrontpageMessageAdmin(SimpleHistoryAdmin):
     readonly_fields = ('created_at', 'updated_at')
 
 
+class PooledIAMUserAdmin(admin.ModelAdmin):
+    """List IAM users waiting in the warm pool."""
+
+    list_display = ('username', 'type', 'account', 'created_on')
+    list_filter = ('type', 'account')
+    readonly_fields = ('type', 'username', 'account', 'created_on')
+
+
+class LendableInventoryAdmin(admin.ModelAdmin):
+    """Display the active checkouts counted per lendable type."""
+
+    list_display = ('type', 'active')
+    readonly_fields = ('type', 'active')
+
+
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    """List users waiting for a lendable type, first come first."""
+
+    list_display = ('type', 'user', 'joined_on')
+    list_filter = ('type',)
+    ordering = ('pk',)
+    readonly_fields = ('joined_on',)
+
+
+class WarmPoolMetricsAdmin(admin.ModelAdmin):
+    """Display warm pool counters per lendable type."""
+
+    list_display = (
+        'type',
+        'hits',
+        'misses',
+        'refills',
+        'average_refill_seconds'
+    )
+    readonly_fields = ('type', 'hits', 'misses', 'refills', 'refill_seconds')
+
+
 admin.site.register(Lendable, LendableAdmin)
+admin.site.register(LendableArchive, LendableArchiveAdmin)
 admin.site.register(FrontpageMessage, FrontpageMessageAdmin)
+admin.site.register(LendableInventory, LendableInventoryAdmin)
+admin.site.register(PooledIAMUser, PooledIAMUserAdmin)
+admin.site.register(WaitlistEntry, WaitlistEntryAdmin)
+admin.site.register(WarmPoolMetrics, WarmPoolMetricsAdmin)
@@ -18,25 +18,354 @@
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
 
 import boto3
+import botocore.config
 import botocore.exceptions
 import collections
+import concurrent.futures
+import functools
 import logging
 import random
+import threading
+import time
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from library import rate_limiter
+from library.circuit_breaker import CircuitBreaker, CircuitOpenError
 
 from logging import CRITICAL, ERROR, WARNING, INFO
 
+# http://docs.aws.amazon.com/IAM/latest/UserGuide/reference_iam-limits.html
+IAM_MAX_USERS = 5000
+
+# What the client engine passes around for an IAM user
+IAMUserName = collections.namedtuple('IAMUserName', ['user_name'])
+
+
+class AWSConnectionCache:
+    """Per-process cache of boto3 sessions, clients and resources.
+
+    Building a session loads the botocore data files and every new client
+    opens its own connection pool, so both are kept for the lifetime of the
+    process and keyed by the credentials they were built with.
+
+    boto3 clients are thread safe and are shared by all threads. Sessions
+    and resources are not, so sessions are only used while holding the
+    cache lock and resources are kept in thread local storage, going away
+    with their thread.
+    """
+
+    logger = logging.getLogger('django')
+
+    def __init__(self):
+        """Initialize empty caches."""
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._clients = {}
+        self._local = threading.local()
+        # Resources built before their generation was bumped are stale
+        self._generation = 0
+        self._key_generations = collections.Counter()
+
+    def _get_config(self):
+        return botocore.config.Config(
+            max_pool_connections=getattr(
+                settings, 'AWS_MAX_POOL_CONNECTIONS', 10
+            )
+        )
+
+    def _get_session(self, aws_access_key_id, aws_secret_access_key):
+        key = (aws_access_key_id, aws_secret_access_key)
+        if key not in self._sessions:
+            self.logger.debug('AWSConnectionCache: opening session')
+            self._sessions[key] = boto3.session.Session(
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key
+            )
+        return self._sessions[key]
+
+    def _rate_limit(self, client, service, aws_access_key_id):
+        if service != 'iam':
+            return
+        bucket = rate_limiter.get_iam_bucket(aws_access_key_id)
+        if bucket:
+            rate_limiter.install(client, bucket)
+
+    def session(self, aws_access_key_id, aws_secret_access_key):
+        """Return the cached session for the given credentials."""
+        with self._lock:
+            return self._get_session(aws_access_key_id, aws_secret_access_key)
+
+    def client(self, service, aws_access_key_id, aws_secret_access_key):
+        """Return a client for service shared by all threads."""
+        key = (service, aws_access_key_id, aws_secret_access_key)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    self.logger.debug(
+                        'AWSConnectionCache: creating %s client' % service
+                    )
+                    session = self._get_session(
+                        aws_access_key_id,
+                        aws_secret_access_key
+                    )
+                    client = session.client(service, config=self._get_config())
+                    self._rate_limit(client, service, aws_access_key_id)
+                    self._clients[key] = client
+        return client
+
+    def resource(self, service, aws_access_key_id, aws_secret_access_key):
+        """Return a resource for service owned by the calling thread."""
+        key = (service, aws_access_key_id, aws_secret_access_key)
+        generation = (self._generation,
+                      self._key_generations[aws_access_key_id])
+        resources = getattr(self._local, 'resources', None)
+        if resources is None:
+            resources = self._local.resources = {}
+        cached_generation, resource = resources.get(key, (None, None))
+        if cached_generation != generation:
+            with self._lock:
+                self.logger.debug(
+                    'AWSConnectionCache: creating %s resource' % service
+                )
+                session = self._get_session(
+                    aws_access_key_id,
+                    aws_secret_access_key
+                )
+                resource = session.resource(service, config=self._get_config())
+                self._rate_limit(
+                    resource.meta.client,
+                    service,
+                    aws_access_key_id
+                )
+                resources[key] = (generation, resource)
+        return resource
+
+    def invalidate(self, aws_access_key_id=None):
+        """Drop cached connections.
+
+        Call this when credentials are rotated. If aws_access_key_id is given
+        only the connections built with that key are dropped.
+        """
+        with self._lock:
+            for cache in (self._sessions, self._clients):
+                for key in list(cache):
+                    if aws_access_key_id in (None, key[-2]):
+                        del cache[key]
+            # Resources live in the storage of their threads
+            if aws_access_key_id is None:
+                self._generation += 1
+            else:
+                self._key_generations[aws_access_key_id] += 1
+
+
+connection_cache = AWSConnectionCache()
+
+
+class IAMUserTeardown:
+    """Remove the dependent resources of an IAM user concurrently.
+
+    Each kind of dependent resource is listed with its own paginator and
+    every item found is removed as soon as its page arrives, all on one
+    bounded thread pool. The low level client is used because, unlike
+    resources, it is safe to share between threads.
+    """
+
+    # (list operation, result key, removal operation, item key, description)
+    dependents = (
+        ('list_access_keys', 'AccessKeyMetadata',
+         'delete_access_key', 'AccessKeyId',
+         "deleting access key %s"),
+        ('list_mfa_devices', 'MFADevices',
+         'deactivate_mfa_device', 'SerialNumber',
+         "disassociating mfa device '%s'"),
+        ('list_signing_certificates', 'Certificates',
+         'delete_signing_certificate', 'CertificateId',
+         "deleting signing certificate %s"),
+        ('list_groups_for_user', 'Groups',
+         'remove_user_from_group', 'GroupName',
+         "removing user from group '%s'"),
+        ('list_attached_user_policies', 'AttachedPolicies',
+         'detach_user_policy', 'PolicyArn',
+         "detaching policy '%s'"),
+    )
+
+    def __init__(self, client, log, max_workers=None):
+        """Initialize teardown with an IAM client and a log callable."""
+        self.client = client
+        self.log = log
+        self.max_workers = max_workers or getattr(
+            settings, 'AWS_TEARDOWN_WORKERS', 5
+        )
+
+    def _list(self, operation, result_key, username):
+        paginator = self.client.get_paginator(operation)
+        items = []
+        for page in paginator.paginate(UserName=username):
+            items.extend(page[result_key])
+        return items
+
+    def _remove(self, operation, item_key, value, description, username):
+        self.log(description % value, depth=1)
+        getattr(self.client, operation)(**{
+            'UserName': username,
+            item_key: value
+        })
+
+    def run(self, username):
+        """Remove every dependent resource of the user.
+
+        All listings and removals are attempted, the first error is raised
+        once the pool has drained.
+        """
+        errors = []
+        caller_priority = rate_limiter.current_priority()
+
+        def submit(function, *args):
+            # Pool threads make their calls with the caller's priority.
+            def call():
+                with rate_limiter.priority(caller_priority):
+                    return function(*args)
+            return pool.submit(call)
+
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+            listings = {
+                submit(self._list, operation, result_key, username):
+                    (remove_operation, item_key, description)
+                for (operation, result_key, remove_operation, item_key,
+                     description) in self.dependents
+            }
+            removals = []
+            for listing in concurrent.futures.as_completed(listings):
+                try:
+                    items = listing.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                remove_operation, item_key, description = listings[listing]
+                removals.extend(
+                    submit(
+                        self._remove,
+                        remove_operation,
+                        item_key,
+                        item[item_key],
+                        description,
+                        username
+                    ) for item in items
+                )
+            for removal in concurrent.futures.as_completed(removals):
+                if removal.exception():
+                    errors.append(removal.exception())
+
+        for error in errors:
+            self.log(error, ERROR, depth=1)
+        if errors:
+            raise errors[0]
+
+
+class IAMUsernameIndex:
+    """Local index of the IAM usernames under the openbare path.
+
+    IAM usernames are case insensitive, so names are stored lower cased.
+    Changes made while a full sync is running are journaled and replayed
+    on top of the listing, so they are not lost to a stale page.
+    """
+
+    def __init__(self, ttl):
+        """Initialize an empty index that goes stale after ttl seconds."""
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._names = set()
+        self._synced_at = None
+        self._journal = None
+
+    def is_stale(self):
+        """Return True if the index needs a full sync."""
+        return (
+            self._synced_at is None or
+            time.time() - self._synced_at > self.ttl
+        )
+
+    def invalidate(self):
+        """Force a full sync on the next lookup."""
+        self._synced_at = None
+
+    def begin_sync(self):
+        """Start journaling changes made while the IAM listing runs."""
+        with self._lock:
+            self._journal = []
+
+    def finish_sync(self, usernames):
+        """Replace the index with a listing and replay journaled changes."""
+        with self._lock:
+            names = set(name.lower() for name in usernames)
+            for name, present in self._journal or []:
+                if present:
+                    names.add(name)
+                else:
+                    names.discard(name)
+            self._names = names
+            self._journal = None
+            self._synced_at = time.time()
+
+    def _record(self, username, present):
+        name = username.lower()
+        with self._lock:
+            if present:
+                self._names.add(name)
+            else:
+                self._names.discard(name)
+            if self._journal is not None:
+                self._journal.append((name, present))
+
+    def add(self, username):
+        """Record a created IAM user."""
+        self._record(username, True)
+
+    def discard(self, username):
+        """Record a deleted IAM user."""
+        self._record(username, False)
+
+    def __contains__(self, username):
+        """Return True if the username is taken."""
+        return username.lower() in self._names
+
+
+def guarded(method):
+    """Run an AmazonAccountUtils method through the account's breaker."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.breaker.call(method, self, *args, **kwargs)
+    return wrapper
+
 
 class AmazonAccountUtils:
     """AWS lendable utils class."""
 
     logger = logging.getLogger('django')
 
-    def __init__(self, aws_access_key_id, aws_secret_access_key):
-        """Initialize access key and secret for AWS account."""
+    def __init__(self, aws_access_key_id, aws_secret_access_key,
+                 name='default', account_id_alias=None):
+        """Initialize access key and secret for AWS account.
+
+        Without account_id_alias the AWS_ACCOUNT_ID_ALIAS setting is used
+        for the console URL.
+        """
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
+        self.name = name
+        self.account_id_alias = account_id_alias
+        self.username_index = IAMUsernameIndex(
+            getattr(settings, 'AWS_USERNAME_INDEX_TTL', 3600)
+        )
+        self.breaker = CircuitBreaker(
+            'iam:%s' % name,
+            'Amazon Web Services is not responding right now. '
+            'Please try again in a few minutes.'
+        )
 
     def log(self, message, level=logging.DEBUG, depth=0):
         """Prepend string to log messages to denote class."""
@@ -81,17 +410,29 @@ class AmazonAccountUtils:
         return ''.join(password_set)[:length]
 
     def _get_aws_session(self):
-        self.log('opening session')
-        return boto3.session.Session(
-            aws_access_key_id=self.aws_access_key_id,
-            aws_secret_access_key=self.aws_secret_access_key
+        return connection_cache.session(
+            self.aws_access_key_id,
+            self.aws_secret_access_key
+        )
+
+    def _get_iam_client(self):
+        return connection_cache.client(
+            'iam',
+            self.aws_access_key_id,
+            self.aws_secret_access_key
         )
 
-    def _get_iam_resource(self, session=None):
-        if not session:
-            session = self._get_aws_session()
+    def _get_iam_resource(self):
         self.log('accessing IAM resource')
-        return session.resource('iam')
+        return connection_cache.resource(
+            'iam',
+            self.aws_access_key_id,
+            self.aws_secret_access_key
+        )
+
+    def invalidate_connections(self):
+        """Drop cached AWS connections for this account's access key."""
+        connection_cache.invalidate(self.aws_access_key_id)
 
     def _get_iam_user(self, username):
         resource = self._get_iam_resource()
@@ -121,61 +462,99 @@ class AmazonAccountUtils:
         )
 
         # First, delete the login profile, so the user can't be logged in
-        # while we are cleaning up. Then roll through the rest of the dependent
-        # resources.
+        # while we are cleaning up. Then tear down the rest of the dependent
+        # resources concurrently; the caller deletes the user last.
         try:
-            iam_user.LoginProfile().delete()
+            self._delete_login_profile(iam_user)
         except botocore.exceptions.ClientError as e:
             self.log(e, ERROR)
-        for access_key in iam_user.access_keys.all():
-            self.log(
-                "deleting access key %s" % (access_key.access_key_id),
-                depth=1
-            )
-            access_key.delete()
-        for mfa_device in iam_user.mfa_devices.all():
-            self.log(
-                "disassociating mfa device '%s' from user '%s'" %
-                (mfa_device.serial_number, iam_user.user_name),
-                depth=1
-            )
-            mfa_device.disassociate()
-        for signing_certificate in iam_user.signing_certificates.all():
-            self.log(
-                "deleting signing certificate %s" %
-                signing_certificate.certificate_id,
-                depth=1
-            )
-            signing_certificate.delete()
-        for group in iam_user.groups.all():
-            self.log(
-                "removing user '%s' from group '%s'" %
-                (iam_user.user_name, group.name),
-                depth=1
-            )
-            iam_user.remove_group(GroupName=group.name)
-        for attached_policy in iam_user.attached_policies.all():
-            self.log(
-                "detaching policy '%s' from user '%s'" %
-                (attached_policy.policy_name, iam_user.user_name),
-                depth=1
-            )
-            iam_user.detach_policy(PolicyArn=attached_policy.arn)
+        IAMUserTeardown(self._get_iam_client(), self.log).run(
+            iam_user.user_name
+        )
         return True
 
+    def list_iam_users(self):
+        """Yield the IAM users under the openbare path, page by page."""
+        paginator = self._get_iam_client().get_paginator('list_users')
+        for page in paginator.paginate(PathPrefix='/openbare/'):
+            for user in page['Users']:
+                yield user
+
+    def sync_username_index(self):
+        """Rebuild the username index from a listing of IAM users."""
+        self.log('syncing IAM username index')
+        self.username_index.begin_sync()
+        self.username_index.finish_sync(
+            user['UserName'] for user in self.list_iam_users()
+        )
+
     def iam_user_exists(self, username):
-        """Return true if account exists."""
-        return True if self._get_iam_user(username) else False
+        """Return true if account exists.
 
-    def create_iam_account(self, username, groups=[]):
-        """Create an IAM account for the given username.
+        Answered from the local username index, which is fully synced when
+        it goes stale. Falls back to probing IAM if the sync fails. Only
+        calls that reach IAM go through the breaker, so index hits don't
+        count as successful calls.
+        """
+        if self.username_index.is_stale():
+            try:
+                self.breaker.call(self.sync_username_index)
+            except botocore.exceptions.ClientError as e:
+                self.log(e, ERROR)
+                return bool(self.breaker.call(self._get_iam_user, username))
+        return username in self.username_index
+
+    def _create_iam_user(self, username):
+        iam_resource = self._get_iam_resource()
+        try:
+            iam_user = iam_resource.User(username).create(Path='/openbare/')
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == 'EntityAlreadyExists':
+                self.username_index.add(username)
+            raise
+        self.username_index.add(username)
+        return iam_user
+
+    def _delete_iam_user(self, iam_user):
+        iam_user.delete()
+        self.username_index.discard(iam_user.user_name)
+
+    def _delete_login_profile(self, iam_user):
+        iam_user.LoginProfile().delete()
+
+    def _add_user_to_group(self, iam_user, group):
+        iam_user.add_group(GroupName=group)
+
+    def _rename_iam_user(self, username, new_username):
+        iam_resource = self._get_iam_resource()
+        iam_resource.User(username).update(NewUserName=new_username)
+        return iam_resource.User(new_username)
+
+    def _create_login_profile(self, iam_user, password):
+        iam_user.create_login_profile(
+            Password=password,
+            PasswordResetRequired=False
+        )
+
+    def _create_access_key(self, iam_user):
+        """Return the id and secret of a new access key."""
+        access_key_pair = iam_user.create_access_key_pair()
+        return (
+            access_key_pair.access_key_id,
+            access_key_pair.secret_access_key
+        )
+
+    def _grant_access(self, iam_user, username):
+        """Create login profile and access key for an IAM user.
 
         Returns:
             The required credentials.
         """
-        self.log("creating IAM user '%s'" % username, INFO)
-
-        alias = getattr(settings, 'AWS_ACCOUNT_ID_ALIAS', None)
+        alias = self.account_id_alias or getattr(
+            settings,
+            'AWS_ACCOUNT_ID_ALIAS',
+            None
+        )
         if alias:
             url = 'https://{}.signin.aws.amazon.com/console'.format(alias)
         else:
@@ -186,33 +565,313 @@ class AmazonAccountUtils:
             ('Username', username),
             ('Password', self._make_password())
         ])
-        iam_resource = self._get_iam_resource()
-        iam_user = iam_resource.User(username).create(Path='/openbare/')
+        self._create_login_profile(iam_user, credentials['Password'])
+        access_key_id, secret_access_key = self._create_access_key(iam_user)
+        credentials.update([
+            ('Access Key ID', access_key_id),
+            ('Secret Access Key', secret_access_key)
+        ])
+        return credentials
+
+    @guarded
+    def create_iam_account(self, username, groups=[]):
+        """Create an IAM account for the given username.
+
+        Returns:
+            The required credentials.
+        """
+        self.log("creating IAM user '%s'" % username, INFO)
+
+        iam_user = self._create_iam_user(username)
         try:
             for group in groups:
-                iam_user.add_group(GroupName=group.strip())
-            iam_user.create_login_profile(
-                Password=credentials['Password'],
-                PasswordResetRequired=False
-            )
-            access_key_pair = iam_user.create_access_key_pair()
-        except Exception as e:
+                self._add_user_to_group(iam_user, group.strip())
+            return self._grant_access(iam_user, username)
+        except Exception:
             self._cleanup_iam_user(iam_user)
-            iam_user.delete()
+            self._delete_iam_user(iam_user)
+            raise
+
+    @guarded
+    def create_pool_account(self, username, groups=[]):
+        """Create an IAM user for the warm pool.
+
+        The user is joined to its groups but has no login profile or access
+        keys until it is claimed with claim_pool_account.
+        """
+        self.log("creating pooled IAM user '%s'" % username, INFO)
+
+        iam_user = self._create_iam_user(username)
+        try:
+            for group in groups:
+                self._add_user_to_group(iam_user, group.strip())
+        except Exception:
+            self._cleanup_iam_user(iam_user)
+            self._delete_iam_user(iam_user)
             raise
-        credentials.update([
-            ('Access Key ID', access_key_pair.access_key_id),
-            ('Secret Access Key', access_key_pair.secret_access_key)
-        ])
-        return credentials
 
+    @guarded
+    def claim_pool_account(self, pool_username, username, release=None):
+        """Rename a pooled IAM user to username and grant it access.
+
+        If the user can not be renamed because username is taken it is left
+        as it was and passed to release, to go back to the pool. After any
+        other failure it is not, a pooled user that is gone or was changed
+        must not be claimed again. If access can not be granted the user is
+        deleted.
+
+        Returns:
+            The required credentials.
+        """
+        self.log(
+            "claiming pooled IAM user '%s' as '%s'" %
+            (pool_username, username),
+            INFO
+        )
+
+        try:
+            iam_user = self._rename_iam_user(pool_username, username)
+        except botocore.exceptions.ClientError as e:
+            if release and \
+                    e.response['Error']['Code'] == 'EntityAlreadyExists':
+                release(pool_username)
+            raise
+        self.username_index.discard(pool_username)
+        self.username_index.add(username)
+        try:
+            return self._grant_access(iam_user, username)
+        except Exception:
+            self._cleanup_iam_user(iam_user)
+            self._delete_iam_user(iam_user)
+            raise
+
+    @guarded
     def destroy_iam_account(self, username):
         """Cleanup and delete IAM user account."""
         self.log("destroying IAM user '%s'" % username, INFO)
         iam_user = self._get_iam_user(username)
         if iam_user:
             self._cleanup_iam_user(iam_user)
-            iam_user.delete()
+            self._delete_iam_user(iam_user)
             return True
         else:
+            self.username_index.discard(username)
             return False
+
+
+class IAMClientAccountUtils(AmazonAccountUtils):
+    """AWS lendable utils built on the low level IAM client.
+
+    Same API as AmazonAccountUtils, but every operation is a single
+    explicit client call. IAM users are passed around as IAMUserName
+    tuples instead of boto3 resources, so no resource objects are built and
+    nothing is loaded lazily.
+    """
+
+    def _get_iam_user(self, username):
+        try:
+            response = self._get_iam_client().get_user(UserName=username)
+        except botocore.exceptions.ClientError:
+            self.log(
+                "user '%s' does not exist" % username,
+                WARNING
+            )
+            return None
+        self.log("user '%s' found" % username)
+        return IAMUserName(response['User']['UserName'])
+
+    def _create_iam_user(self, username):
+        try:
+            self._get_iam_client().create_user(
+                Path='/openbare/',
+                UserName=username
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == 'EntityAlreadyExists':
+                self.username_index.add(username)
+            raise
+        self.username_index.add(username)
+        return IAMUserName(username)
+
+    def _delete_iam_user(self, iam_user):
+        self._get_iam_client().delete_user(UserName=iam_user.user_name)
+        self.username_index.discard(iam_user.user_name)
+
+    def _delete_login_profile(self, iam_user):
+        self._get_iam_client().delete_login_profile(
+            UserName=iam_user.user_name
+        )
+
+    def _add_user_to_group(self, iam_user, group):
+        self._get_iam_client().add_user_to_group(
+            GroupName=group,
+            UserName=iam_user.user_name
+        )
+
+    def _rename_iam_user(self, username, new_username):
+        self._get_iam_client().update_user(
+            UserName=username,
+            NewUserName=new_username
+        )
+        return IAMUserName(new_username)
+
+    def _create_login_profile(self, iam_user, password):
+        self._get_iam_client().create_login_profile(
+            UserName=iam_user.user_name,
+            Password=password,
+            PasswordResetRequired=False
+        )
+
+    def _create_access_key(self, iam_user):
+        """Return the id and secret of a new access key."""
+        access_key = self._get_iam_client().create_access_key(
+            UserName=iam_user.user_name
+        )['AccessKey']
+        return access_key['AccessKeyId'], access_key['SecretAccessKey']
+
+
+# AWS_IAM_ENGINE values and the utils classes implementing them
+ENGINES = {
+    'resource': AmazonAccountUtils,
+    'client': IAMClientAccountUtils,
+}
+
+
+def get_engine(name=None):
+    """Return the utils class of an engine, AWS_IAM_ENGINE by default."""
+    name = name or getattr(settings, 'AWS_IAM_ENGINE', 'resource')
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            'AWS_IAM_ENGINE must be one of %s, not %r' % (
+                ', '.join(sorted(ENGINES)), name
+            )
+        )
+
+
+class AmazonAccountPool:
+    """AWS accounts that demo account IAM users are spread across.
+
+    IAM limits the number of users in an account, so checkouts are routed
+    to the least loaded account with room left. Occupancy is counted by a
+    loader callable returning a dict of account name to IAM users in use.
+    The counts are cached for ttl seconds and bumped locally as accounts
+    are picked, so the database is not counted on every checkout.
+    """
+
+    def __init__(self, accounts, ttl=60, engine=None):
+        """Initialize pool from a list of account dicts.
+
+        Each account has a name, access_key_id and secret_access_key and
+        optionally an account_id_alias and max_users. The first account is
+        the default one. engine names the utils class, see get_engine.
+        """
+        utils_class = get_engine(engine)
+        self.accounts = collections.OrderedDict()
+        self.max_users = {}
+        for account in accounts:
+            name = account['name']
+            self.accounts[name] = utils_class(
+                account['access_key_id'],
+                account['secret_access_key'],
+                name=name,
+                account_id_alias=account.get('account_id_alias')
+            )
+            self.max_users[name] = account.get('max_users', IAM_MAX_USERS)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    @classmethod
+    def from_settings(cls):
+        """Return pool of AWS_ACCOUNTS or the single configured account."""
+        accounts = getattr(settings, 'AWS_ACCOUNTS', None) or [{
+            'name': 'default',
+            'access_key_id': settings.AWS_ACCESS_KEY_ID,
+            'secret_access_key': settings.AWS_SECRET_ACCESS_KEY,
+        }]
+        return cls(
+            accounts,
+            getattr(settings, 'AWS_ACCOUNT_OCCUPANCY_TTL', 60)
+        )
+
+    @property
+    def default(self):
+        """Return utils of the default account."""
+        return next(iter(self.accounts.values()))
+
+    def get(self, name):
+        """Return utils of the named account, the default one if empty.
+
+        Rows of an account that is no longer configured, for instance
+        after AWS_ACCOUNTS was renamed, are looked after by the default
+        account too.
+        """
+        if not name:
+            return self.default
+        utils = self.accounts.get(name)
+        if utils is None:
+            utils = self.default
+            utils.log(
+                "AWS account '%s' is not configured, using '%s'" %
+                (name, utils.name),
+                logging.WARNING
+            )
+        return utils
+
+    def capacity(self):
+        """Return the number of IAM users all accounts can hold."""
+        return sum(self.max_users.values())
+
+    def invalidate(self):
+        """Forget cached occupancy counts."""
+        with self._lock:
+            self._occupancy = None
+            self._loaded_at = 0
+
+    def occupancy(self, loader):
+        """Return cached IAM users in use per account, loading if stale."""
+        with self._lock:
+            if self._occupancy is None or \
+                    time.time() - self._loaded_at > self.ttl:
+                counts = loader()
+                self._occupancy = dict(
+                    (name, counts.get(name, 0)) for name in self.accounts
+                )
+                self._loaded_at = time.time()
+            return dict(self._occupancy)
+
+    def choose(self, loader):
+        """Pick the least loaded account with room and available service.
+
+        Raises:
+            CircuitOpenError if every account with room is unavailable.
+
+        Returns:
+            Utils of the chosen account or None if all accounts are full.
+        """
+        occupancy = self.occupancy(loader)
+        candidates = sorted(
+            (name for name in self.accounts
+             if occupancy[name] < self.max_users[name]),
+            key=lambda name: occupancy[name] / self.max_users[name]
+        )
+        error = None
+        for name in candidates:
+            try:
+                self.accounts[name].breaker.check()
+            except CircuitOpenError as e:
+                error = e
+                continue
+            self.record(name, 1)
+            return self.accounts[name]
+        if error:
+            raise error
+        return None
+
+    def record(self, name, delta):
+        """Adjust the cached occupancy of an account."""
+        with self._lock:
+            if self._occupancy is not None and name in self._occupancy:
+                self._occupancy[name] += delta
@@ -0,0 +1,34 @@
+"""Application configuration for library app."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+from django.apps import AppConfig
+
+
+class LibraryConfig(AppConfig):
+    """Configure library app."""
+
+    name = 'library'
+
+    def ready(self):
+        """Register lendable types and signal receivers once every model
+        is loaded."""
+        from library import signals
+        from library.models import Lendable
+        Lendable.register_types()
+        signals.connect()
@@ -0,0 +1,87 @@
+"""Availability of lendable types for checkout."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+
+from datetime import datetime
+
+from django.db.models import Case, Count, IntegerField, When
+from django.utils import timezone
+
+from library.models import Lendable
+
+TypeAvailability = collections.namedtuple(
+    'TypeAvailability',
+    ['active', 'held']
+)
+
+
+class AvailabilitySnapshot:
+    """Checkout availability of every lendable type, from one query.
+
+    For each type the number of active checkouts and the number held by
+    the user are aggregated in a single grouped query, however many lendable
+    types are registered. Overdue lendables are left out and expired.
+    """
+
+    def __init__(self, user=None):
+        """Aggregate active lendables per type for user."""
+        user_id = user.pk if user and user.is_authenticated else None
+        now = datetime.now(timezone.utc)
+        rows = Lendable.all_types.order_by().values('type').annotate(
+            active=Count(Case(
+                When(due_on__gt=now, then=1),
+                output_field=IntegerField()
+            )),
+            held=Count(Case(
+                When(due_on__gt=now, user_id=user_id, then=1),
+                output_field=IntegerField()
+            )),
+            overdue=Count(Case(
+                When(due_on__lte=now, then=1),
+                output_field=IntegerField()
+            ))
+        )
+        self.types = {}
+        for row in rows:
+            if row['overdue']:
+                Lendable.expire_overdue(row['type'])
+            self.types[row['type']] = TypeAvailability(
+                row['active'],
+                row['held']
+            )
+
+    def for_type(self, lendable_class):
+        """Return the TypeAvailability of a lendable class."""
+        return self.types.get(
+            lendable_class.__name__.lower(),
+            TypeAvailability(0, 0)
+        )
+
+    def is_available_for_user(self, lendable_class):
+        """Return True if the user can checkout lendable_class."""
+        availability = self.for_type(lendable_class)
+        return (
+            availability.active < lendable_class.max_checked_out and
+            availability.held == 0
+        )
+
+    def next_available_date(self, lendable_class):
+        """Return the date a lendable_class is available for checkout."""
+        return lendable_class.next_available_date()
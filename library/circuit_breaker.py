@@ -0,0 +1,175 @@
+"""Circuit breaker for calls to remote services."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import botocore.exceptions
+import collections
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Error codes AWS returns when the service, not the request, is at fault.
+SERVICE_ERROR_CODES = (
+    'InternalFailure',
+    'InternalError',
+    'ServiceFailure',
+    'ServiceUnavailable',
+    'RequestTimeout',
+    'Throttling',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service while its circuit is open."""
+
+
+def is_service_failure(error):
+    """Return True if error means the service is unhealthy.
+
+    Errors caused by the request itself, such as a missing entity, show
+    the service is answering and do not count against it.
+    """
+    if isinstance(error, botocore.exceptions.ClientError):
+        status = error.response.get(
+            'ResponseMetadata', {}
+        ).get('HTTPStatusCode', 0)
+        return (
+            error.response['Error']['Code'] in SERVICE_ERROR_CODES or
+            status >= 500
+        )
+    return isinstance(error, botocore.exceptions.BotoCoreError)
+
+
+class CircuitBreaker:
+    """Stop calling a service after repeated failures or slow calls.
+
+    After failure_threshold consecutive failures, a failure being an
+    error from is_service_failure or a call slower than slow_call_seconds,
+    the circuit opens and calls fail fast with CircuitOpenError. Once
+    reset_seconds have passed a single trial call is let through
+    (half-open); it closes the circuit on success and opens it again on
+    failure. Thresholds are read from settings on every call.
+    """
+
+    logger = logging.getLogger('django')
+
+    def __init__(self, name, message):
+        """Initialize a closed circuit reporting message when open."""
+        self.name = name
+        self.message = message
+        self._lock = threading.Lock()
+        self.transitions = collections.deque(maxlen=20)
+        self.reset()
+
+    @property
+    def failure_threshold(self):
+        return getattr(settings, 'AWS_BREAKER_FAILURE_THRESHOLD', 5)
+
+    @property
+    def slow_call_seconds(self):
+        return getattr(settings, 'AWS_BREAKER_SLOW_CALL_SECONDS', 10)
+
+    @property
+    def reset_seconds(self):
+        return getattr(settings, 'AWS_BREAKER_RESET_SECONDS', 30)
+
+    def reset(self):
+        """Close the circuit and forget failures."""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def _transition(self, state):
+        self.logger.warning(
+            "CircuitBreaker %s: %s -> %s" % (self.name, self.state, state)
+        )
+        self.transitions.append((time.time(), self.state, state))
+        self.state = state
+
+    def _cooled_down(self):
+        return time.time() - self.opened_at >= self.reset_seconds
+
+    def check(self):
+        """Raise CircuitOpenError if calls are currently rejected."""
+        if self.state == OPEN and not self._cooled_down():
+            raise CircuitOpenError(self.message)
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                if not self._cooled_down():
+                    raise CircuitOpenError(self.message)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    raise CircuitOpenError(self.message)
+                self._trial_running = True
+                return True
+            return False
+
+    def _after_call(self, failed):
+        with self._lock:
+            self._trial_running = False
+            if not failed:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._transition(CLOSED)
+                return
+
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and
+                self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.time()
+                self._transition(OPEN)
+
+    def call(self, function, *args, **kwargs):
+        """Call function through the circuit."""
+        self._before_call()
+        started = time.time()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self._after_call(is_service_failure(e))
+            raise
+        self._after_call(time.time() - started > self.slow_call_seconds)
+        return result
+
+    def snapshot(self):
+        """Return the circuit state for monitoring."""
+        return {
+            'name': self.name,
+            'state': self.state,
+            'failures': self.failures,
+            'opened_at': self.opened_at,
+            'transitions': [
+                {'at': at, 'from': old, 'to': new}
+                for at, old, new in self.transitions
+            ],
+        }
@@ -0,0 +1,152 @@
+"""Forecast of when checked out lendables come back."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import collections
+import threading
+import time
+
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class TypeForecast:
+    """Sorted due dates of the active lendables of a type."""
+
+    def __init__(self, due_dates=()):
+        """Initialize forecast from unordered due dates."""
+        self.due_dates = sorted(due_dates)
+
+    def add(self, due_on):
+        """Add the due date of a lendable checked out."""
+        bisect.insort(self.due_dates, due_on)
+
+    def remove(self, due_on):
+        """Remove the due date of a lendable returned."""
+        i = bisect.bisect_left(self.due_dates, due_on)
+        if i < len(self.due_dates) and self.due_dates[i] == due_on:
+            del self.due_dates[i]
+
+    def drop_overdue(self, now):
+        """Forget due dates up to now, the lendables are being expired."""
+        del self.due_dates[:bisect.bisect_right(self.due_dates, now)]
+
+    def available_on(self, capacity, slots=1):
+        """Return when slots of capacity will be free.
+
+        Returns:
+            None if they are free now, otherwise the due date of the
+            return that frees the last of them.
+
+        Raises:
+            ValueError if slots exceeds capacity.
+        """
+        if slots > capacity:
+            raise ValueError(
+                'Only %d can be checked out at once' % capacity
+            )
+        returns = slots - (capacity - len(self.due_dates))
+        if returns <= 0:
+            return None
+        return self.due_dates[returns - 1]
+
+    def timeline(self, capacity, limit):
+        """Return (due date, slots free) of the next limit returns."""
+        free = max(capacity - len(self.due_dates), 0)
+        return [
+            (due_on, free + i + 1)
+            for i, due_on in enumerate(self.due_dates[:limit])
+        ]
+
+
+class AvailabilityForecast:
+    """Forecast of returns of every lendable type.
+
+    The due dates of active lendables are loaded by a loader callable
+    returning (type, due_on) pairs. They are cached for ttl seconds and
+    kept up to date locally as lendables are checked out, renewed and
+    checked in, so the database is not queried on every page view.
+    """
+
+    def __init__(self, ttl=60):
+        """Initialize an empty forecast."""
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    @classmethod
+    def from_settings(cls):
+        """Return forecast cached for AVAILABILITY_FORECAST_TTL seconds."""
+        return cls(getattr(settings, 'AVAILABILITY_FORECAST_TTL', 60))
+
+    def invalidate(self):
+        """Forget cached due dates."""
+        with self._lock:
+            self._types = None
+            self._loaded_at = 0
+
+    def _for_type(self, lendable_type, loader):
+        """Return the TypeForecast of a type, loading if stale.
+
+        Call with the lock held.
+        """
+        if self._types is None or time.time() - self._loaded_at > self.ttl:
+            due_dates = collections.defaultdict(list)
+            for row_type, due_on in loader():
+                due_dates[row_type].append(due_on)
+            self._types = dict(
+                (row_type, TypeForecast(dates))
+                for row_type, dates in due_dates.items()
+            )
+            self._loaded_at = time.time()
+        forecast = self._types.setdefault(lendable_type, TypeForecast())
+        forecast.drop_overdue(datetime.now(timezone.utc))
+        return forecast
+
+    def available_on(self, lendable_type, capacity, loader, slots=1):
+        """Return when slots of a type will be free, None if now."""
+        with self._lock:
+            return self._for_type(lendable_type, loader).available_on(
+                capacity,
+                slots
+            )
+
+    def timeline(self, lendable_type, capacity, loader, limit=5):
+        """Return (due date, slots free) of the next returns of a type."""
+        with self._lock:
+            return self._for_type(lendable_type, loader).timeline(
+                capacity,
+                limit
+            )
+
+    def record(self, lendable_type, removed=None, added=None):
+        """Move a due date of a type in the cached forecast.
+
+        removed is the due date of a lendable returned or renewed, added
+        the due date of a lendable checked out or renewed.
+        """
+        with self._lock:
+            if self._types is None or lendable_type not in self._types:
+                return
+            if removed:
+                self._types[lendable_type].remove(removed)
+            if added:
+                self._types[lendable_type].add(added)
@@ -0,0 +1,178 @@
+"""Cache of the parts of the home page context."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+class IndexContextCache:
+    """Parts of the home page context, cached until what they show changes.
+
+    Each value depends on scopes, such as a lendable type or the frontpage
+    messages. Every scope has a version kept in the cache backend, so that
+    a change seen by one process is seen by all of them. Values are cached
+    under the versions of their scopes and invalidating a scope bumps its
+    version. Values also expire after ttl seconds, as availability changes
+    with time too. A ttl of 0 disables the cache.
+
+    The backend has to be shared by every process, otherwise a change made
+    by one process leaves the others serving what they cached before.
+
+    Hits and misses are counted per process.
+    """
+
+    prefix = 'library:index'
+
+    def __init__(self, ttl=60, alias='default'):
+        """Initialize cache on the backend named alias."""
+        self.ttl = ttl
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def from_settings(cls):
+        """Return cache configured by INDEX_CACHE_TTL and INDEX_CACHE_ALIAS.
+
+        Unless INDEX_CACHE_TTL is set the cache is only enabled on a shared
+        backend.
+        """
+        cache = cls(ttl=0, alias=getattr(settings, 'INDEX_CACHE_ALIAS',
+                                         'default'))
+        cache.ttl = getattr(settings, 'INDEX_CACHE_TTL',
+                            60 if cache.shared else 0)
+        return cache
+
+    @property
+    def cache(self):
+        """Return the cache backend."""
+        return caches[self.alias]
+
+    @property
+    def shared(self):
+        """Return True if the backend is shared by every process."""
+        return not isinstance(self.cache, (DummyCache, LocMemCache))
+
+    def reset_stats(self):
+        """Reset the hit and miss counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit and miss counters."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _version_key(self, scope):
+        return '%s:version:%s' % (self.prefix, scope)
+
+    def _initial_version(self):
+        # Versions start from the clock, so an evicted version never
+        # brings back values cached under an older one.
+        return int(time.time() * 1000)
+
+    def versions(self, scopes):
+        """Return the current version of each scope."""
+        keys = dict((self._version_key(scope), scope) for scope in scopes)
+        found = self.cache.get_many(list(keys))
+        versions = {}
+        for key, scope in keys.items():
+            if key not in found:
+                initial = self._initial_version()
+                self.cache.add(key, initial, None)
+                found[key] = self.cache.get(key, initial)
+            versions[scope] = found[key]
+        return versions
+
+    def invalidate(self, scope):
+        """Drop every value depending on scope.
+
+        Within a transaction the version is bumped at once, so the
+        transaction sees its own changes, and again on commit, as other
+        processes may meanwhile have cached what was there before.
+        """
+        self._bump(scope)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._bump(scope))
+
+    def _bump(self, scope):
+        key = self._version_key(scope)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, self._initial_version(), None)
+
+    def get(self, name, scopes, loader):
+        """Return the value of name, calling loader if it is not cached."""
+        return self.get_many(
+            {name: scopes},
+            lambda missing: {name: loader()}
+        )[name]
+
+    def get_many(self, names, loader):
+        """Return the values of names, loading those not cached.
+
+        Args:
+            names: Dictionary of the name of each value to the scopes it
+                depends on.
+            loader: Callable returning a dictionary of the values of the
+                names it is given.
+        """
+        if not self.ttl:
+            return loader(list(names))
+
+        versions = self.versions(
+            set(scope for scopes in names.values() for scope in scopes)
+        )
+        keys = dict(
+            ('%s:%s:%s' % (
+                self.prefix,
+                name,
+                '.'.join(str(versions[scope]) for scope in scopes)
+            ), name)
+            for name, scopes in names.items()
+        )
+        values = dict(
+            (keys[key], value)
+            for key, value in self.cache.get_many(list(keys)).items()
+        )
+        missing = [name for name in names if name not in values]
+        with self._lock:
+            self.hits += len(values)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = loader(missing)
+            self.cache.set_many(
+                dict((key, loaded[name]) for key, name in keys.items()
+                     if name in loaded),
+                self.ttl
+            )
+            values.update(loaded)
+        return values
+
+
+index_cache = IndexContextCache.from_settings()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library.models import LendableArchive
+
+
+class Command(BaseCommand):
+    help = ('Moves lendables returned long ago to the archive, keeping the '
+            'lendable table as small as the active checkouts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'LENDABLE_ARCHIVE_DAYS', 90),
+            help='Archive lendables checked in more than this many days ago.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of lendables moved per transaction.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the lendables to archive without moving them.'
+        )
+
+    def handle(self, *args, **options):
+        """Archive returned lendables one batch at a time."""
+        days = max(options['days'], 0)
+        if options['dry_run']:
+            self.stdout.write('%d lendables to archive' % (
+                LendableArchive.archivable(days).count()
+            ))
+            return
+
+        batch_size = max(options['batch_size'], 1)
+        archived = 0
+        while True:
+            moved = LendableArchive.archive_batch(days, batch_size)
+            archived += moved
+            if moved < batch_size:
+                break
+        self.stdout.write('%d lendables archived' % archived)
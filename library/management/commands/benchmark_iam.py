@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import time
+
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+
+from library.amazon_account_utils import ENGINES
+from library.mock_aws.aws_endpoints import AWSMock
+
+
+def benchmark(engine, iterations):
+    """Check, create and destroy IAM accounts against the AWS mock.
+
+    Returns:
+        A tuple of (requests by operation, wall time in seconds).
+    """
+    mocker = AWSMock()
+    mocker.create_group({'GroupName': 'Admins'})
+    requests = collections.Counter()
+
+    def counting_api_call(client, operation_name, kwarg):
+        requests[operation_name] += 1
+        return mocker.mock_make_api_call(operation_name, kwarg)
+
+    utils = ENGINES[engine]('benchmark-%s' % engine, 'secret')
+    with patch('botocore.client.BaseClient._make_api_call',
+               new=counting_api_call):
+        started = time.time()
+        for i in range(iterations):
+            username = 'benchmark%d' % i
+            utils.iam_user_exists(username)
+            utils.create_iam_account(username, ['Admins'])
+            utils.destroy_iam_account(username)
+        return requests, time.time() - started
+
+
+class Command(BaseCommand):
+    help = ('Compares the AWS requests and wall time of the IAM engines by '
+            'creating and destroying accounts against the AWS mock.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Number of accounts each engine creates and destroys.'
+        )
+        parser.add_argument(
+            '--engine',
+            choices=sorted(ENGINES),
+            action='append',
+            help='Engine to benchmark, may be repeated. Defaults to all.'
+        )
+
+    def handle(self, *args, **options):
+        """Run the benchmark and print a summary per engine."""
+        iterations = max(options['iterations'], 1)
+        self.stdout.write('%-10s %10s %14s %14s' % (
+            'engine', 'requests', 'requests/acct', 'ms/acct'
+        ))
+        for engine in options['engine'] or sorted(ENGINES):
+            requests, seconds = benchmark(engine, iterations)
+            total = sum(requests.values())
+            self.stdout.write('%-10s %10d %14.1f %14.2f' % (
+                engine,
+                total,
+                total / iterations,
+                seconds * 1000 / iterations
+            ))
+            if options['verbosity'] > 1:
+                for operation, count in sorted(requests.items()):
+                    self.stdout.write('    %-30s %6d' % (operation, count))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from datetime import datetime
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, models
+from django.utils import timezone
+
+from library.models import Lendable
+
+
+def fake_row(lendable_type):
+    """Return field names and values of a lendable row as fetched."""
+    now = datetime.now(timezone.utc)
+    values = {
+        'id': 1,
+        'type': lendable_type,
+        'checked_out_on': now,
+        'due_on': now,
+        'user_id': 1,
+        'username': 'benchmark',
+    }
+    fields = Lendable._meta.concrete_fields
+    return (
+        [field.attname for field in fields],
+        [values.get(field.attname, field.get_default()) for field in fields]
+    )
+
+
+def scan_init(self, *args, **kwargs):
+    """Lendable.__init__ as it was before the type registry."""
+    models.Model.__init__(self, *args, **kwargs)
+    subclass = [
+        x for x in self.__class__.__subclasses__() if (
+            x.__name__.lower() == self.type
+        )
+    ]
+    if subclass:
+        self.__class__ = subclass[0]
+    else:
+        self.type = self.__class__.__name__.lower()
+
+
+def build_registry(field_names, values, rows):
+    """Build rows through Lendable.from_db."""
+    for i in range(rows):
+        Lendable.from_db(DEFAULT_DB_ALIAS, field_names, values)
+
+
+def build_scan(field_names, values, rows):
+    """Build rows the way the ORM did before the type registry."""
+    from_db = models.Model.from_db.__func__
+    with patch.object(Lendable, '__init__', scan_init):
+        for i in range(rows):
+            from_db(Lendable, DEFAULT_DB_ALIAS, field_names, values)
+
+
+class Command(BaseCommand):
+    help = ('Times building lendable rows with the type registry against '
+            'the subclass scan it replaced.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=10000,
+            help='Number of rows to build per method.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of runs per method, the fastest is reported.'
+        )
+
+    def handle(self, *args, **options):
+        """Build rows of the first lendable type and print timings."""
+        lendable_type = next(iter(Lendable.lendable_types), 'lendable')
+        field_names, values = fake_row(lendable_type)
+        rows = max(options['rows'], 1)
+
+        self.stdout.write('%-10s %10s %12s' % ('method', 'ms', 'us/row'))
+        for method, build in (('registry', build_registry),
+                              ('scan', build_scan)):
+            best = None
+            for run in range(max(options['repeat'], 1)):
+                started = time.perf_counter()
+                build(field_names, values, rows)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write('%-10s %10.1f %12.2f' % (
+                method,
+                best * 1000,
+                best * 1000000 / rows
+            ))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from library.models import Lendable
+
+# Plan lines showing the whole lendable table is read, per database vendor
+FULL_SCANS = {
+    'sqlite': re.compile(r'^SCAN (TABLE )?library_lendable(?! USING)'),
+    'postgresql': re.compile(r'Seq Scan on library_lendable\b'),
+}
+
+
+def canonical_queries():
+    """Return (name, queryset) of the hot queries on lendables."""
+    now = datetime.now(timezone.utc)
+    return [
+        ('active lendables of a type',
+         Lendable.all_types.filter(type='amazondemoaccount')),
+        ('checked out by a user',
+         Lendable.all_types.filter(user_id=1).order_by('checked_out_on')),
+        ('checkout admission',
+         Lendable.all_types.filter(type='amazondemoaccount',
+                                   user_id=1).values('pk')[:1]),
+        ('expired lendables',
+         Lendable.all_types.filter(due_on__lte=now)),
+        ('expiration warnings',
+         Lendable.all_types.filter(
+             Q(due_on__lte=now + timedelta(7)) &
+             (Q(notify_timer=None) | Q(notify_timer__gt=7))
+         )),
+        ('availability snapshot',
+         Lendable.all_types.order_by().values('type').annotate(
+             active=Count('pk')
+         )),
+        ('forecast of returns',
+         Lendable.active_due_dates()),
+        ('checked out page',
+         Lendable.all_types.filter(
+             Q(due_on__gt=now) | Q(due_on=now, pk__gt=1),
+             type='amazondemoaccount'
+         ).order_by('due_on', 'pk').values_list(
+             'pk', 'user__username', 'due_on', 'renewals'
+         )[:51]),
+        ('pending provisioning',
+         Lendable.all_types.filter(
+             state=Lendable.QUEUED
+         ).order_by('checked_out_on')),
+        ('pending teardown',
+         Lendable.all_lendables.filter(
+             teardown_pending=True
+         ).order_by('checked_in_on')),
+    ]
+
+
+def explain(queryset):
+    """Return the plan lines of a queryset on the default database."""
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' \
+        else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return ['\t'.join(str(column) for column in row) for row in rows]
+
+
+class Command(BaseCommand):
+    help = ('Prints the database plans of the hot queries on lendables, '
+            'to spot queries that no longer use an index.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Fail if a query reads the whole lendable table.'
+        )
+
+    def handle(self, *args, **options):
+        """Explain every canonical query."""
+        full_scan = FULL_SCANS.get(connection.vendor)
+        if options['check'] and not full_scan:
+            raise CommandError(
+                'Plans can not be checked on %s' % connection.vendor
+            )
+
+        failed = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Small tables are read sequentially whatever the indexes,
+                # make the planner show the index it would use instead.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, queryset in canonical_queries():
+                plan = explain(queryset)
+                scans = full_scan and any(
+                    full_scan.search(line) for line in plan
+                )
+                if scans:
+                    failed.append(name)
+                self.stdout.write('%s%s' % (
+                    name,
+                    ' (full scan)' if scans else ''
+                ))
+                for line in plan:
+                    self.stdout.write('    %s' % line)
+
+        if options['check'] and failed:
+            raise CommandError(
+                'Queries reading the whole lendable table: %s' %
+                ', '.join(failed)
+            )
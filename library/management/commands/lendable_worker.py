@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.models import Lendable
+from library.worker import (provision_pending, refill_warm_pool,
+                            teardown_pending)
+
+
+class Command(BaseCommand):
+    help = ('Provisions lendables that were checked out asynchronously, '
+            'tears down returned lendables queued for teardown, forgets '
+            'credentials left uncollected and keeps the warm pool full.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process pending lendables once and exit.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls of the database.'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Maximum number of lendables to process per poll.'
+        )
+
+    def handle(self, *args, **options):
+        """Poll the database for pending lendables and provision them."""
+        while True:
+            count = provision_pending(options['limit'])
+            if count:
+                self.stdout.write('Provisioned %d lendable(s)' % count)
+            count = teardown_pending(options['limit'])
+            if count:
+                self.stdout.write('Tore down %d lendable(s)' % count)
+            count = Lendable.expire_pending_credentials()
+            if count:
+                self.stdout.write(
+                    'Forgot uncollected credentials of %d lendable(s)' % count
+                )
+            count = refill_warm_pool()
+            if count:
+                self.stdout.write('Added %d user(s) to the warm pool' % count)
+            if options['once']:
+                break
+            time.sleep(options['interval'])
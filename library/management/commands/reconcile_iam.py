@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import concurrent.futures
+import django
+import json
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library import rate_limiter
+from library.models import AmazonDemoAccount, Lendable, PooledIAMUser
+
+
+def sort_merge(iam_usernames, lendables):
+    """Diff sorted IAM usernames against sorted (username, state) rows.
+
+    IAM usernames are case insensitive, so both sides are compared lower
+    cased and must be sorted on that key.
+
+    Returns:
+        A tuple of (matched, orphaned, missing) where orphaned are IAM users
+        without an active lendable and missing are active lendables without
+        an IAM user.
+    """
+    matched, orphaned, missing = 0, [], []
+    iam_iter, lendable_iter = iter(iam_usernames), iter(lendables)
+    iam_username = next(iam_iter, None)
+    lendable = next(lendable_iter, None)
+    while iam_username is not None or lendable is not None:
+        if lendable is None or (
+            iam_username is not None and
+            iam_username.lower() < lendable[0].lower()
+        ):
+            orphaned.append(iam_username)
+            iam_username = next(iam_iter, None)
+        elif iam_username is None or (
+            lendable[0].lower() < iam_username.lower()
+        ):
+            # Queued and provisioning lendables may have no IAM user yet
+            if lendable[1] not in (Lendable.QUEUED, Lendable.PROVISIONING):
+                missing.append(lendable[0])
+            lendable = next(lendable_iter, None)
+        else:
+            matched += 1
+            iam_username = next(iam_iter, None)
+            lendable = next(lendable_iter, None)
+    return matched, orphaned, missing
+
+
+class Command(BaseCommand):
+    help = ('Compares IAM users under /openbare/ with checked out demo '
+            'accounts, destroys orphaned IAM users and prints a JSON '
+            'summary line per AWS account.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report orphaned IAM users without destroying them.'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help=('Ignore IAM users created less than this many minutes ago, '
+                  'they may belong to a checkout in progress.')
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'AWS_TEARDOWN_WORKERS', 5),
+            help='Number of orphaned IAM users destroyed in parallel.'
+        )
+
+    def handle(self, *args, **options):
+        """Reconcile IAM users with active lendables."""
+        with rate_limiter.priority(rate_limiter.BACKGROUND):
+            for utils in AmazonDemoAccount.amazon_accounts.accounts.values():
+                self.reconcile(utils, options)
+
+    def destroy(self, utils, username):
+        """Destroy an orphaned IAM user from a pool thread."""
+        with rate_limiter.priority(rate_limiter.BACKGROUND):
+            return utils.destroy_iam_account(username)
+
+    def reconcile(self, utils, options):
+        """Diff IAM users of an account against its lendables and report."""
+        cutoff = (
+            datetime.now(django.utils.timezone.utc) -
+            timedelta(minutes=options['min_age'])
+        )
+        pooled = set(
+            username.lower() for username in
+            PooledIAMUser.objects.filter(
+                AmazonDemoAccount.in_account(utils)
+            ).values_list('username', flat=True)
+        )
+
+        try:
+            iam_users = [
+                user for user in utils.list_iam_users()
+                if user['UserName'].lower() not in pooled
+            ]
+        except Exception as e:
+            raise CommandError('Failed to list IAM users of %s: %s' % (
+                utils.name, str(e)
+            ))
+
+        recent = set(
+            user['UserName'] for user in iam_users
+            if options['min_age'] > 0 and user['CreateDate'] > cutoff
+        )
+        iam_usernames = sorted(
+            (user['UserName'] for user in iam_users),
+            key=str.lower
+        )
+        lendables = sorted(
+            AmazonDemoAccount.lendables.filter(
+                AmazonDemoAccount.in_account(utils)
+            ).values_list(
+                'username', 'state'
+            ).iterator(),
+            key=lambda lendable: lendable[0].lower()
+        )
+        matched, orphaned, missing = sort_merge(iam_usernames, lendables)
+        skipped = [name for name in orphaned if name in recent]
+        orphaned = [name for name in orphaned if name not in recent]
+
+        destroyed, failed = [], {}
+        if not options['dry_run'] and orphaned:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max(options['workers'], 1)) as pool:
+                futures = {
+                    pool.submit(self.destroy, utils, username): username
+                    for username in orphaned
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    if future.exception():
+                        failed[futures[future]] = str(future.exception())
+                    else:
+                        destroyed.append(futures[future])
+
+        self.stdout.write(json.dumps({
+            'account': utils.name,
+            'iam_users': len(iam_usernames),
+            'lendables': len(lendables),
+            'matched': matched,
+            'pooled': len(pooled),
+            'skipped_recent': skipped,
+            'orphaned': orphaned,
+            'destroyed': sorted(destroyed),
+            'failed': failed,
+            'missing': missing,
+            'dry_run': options['dry_run'],
+        }, sort_keys=True))
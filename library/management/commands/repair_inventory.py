@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+
+from library.models import LendableInventory
+
+
+class Command(BaseCommand):
+    help = ('Recounts the active lendables of every type and corrects the '
+            'inventory counters used to admit checkouts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report wrong counters without correcting them.'
+        )
+
+    def handle(self, *args, **options):
+        """Rebuild the inventory counters from the lendables."""
+        repaired = LendableInventory.rebuild(dry_run=options['dry_run'])
+        for lendable_type, (stored, actual) in sorted(repaired.items()):
+            self.stdout.write('%s: counter %s, %d active%s' % (
+                lendable_type,
+                'missing' if stored is None else stored,
+                actual,
+                '' if options['dry_run'] else ', repaired'
+            ))
+        if not repaired:
+            self.stdout.write('All inventory counters are correct')
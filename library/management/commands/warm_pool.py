@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+
+from library.models import PooledIAMUser, WarmPoolMetrics
+from library.worker import refill_warm_pool
+
+
+class Command(BaseCommand):
+    help = 'Fills the warm pool of IAM users and reports its metrics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Only report pool metrics, do not refill.'
+        )
+
+    def handle(self, *args, **options):
+        """Refill the warm pool and print its metrics."""
+        if not options['stats']:
+            self.stdout.write(
+                'Added %d user(s) to the warm pool' % refill_warm_pool()
+            )
+
+        for metrics in WarmPoolMetrics.objects.order_by('type'):
+            self.stdout.write(
+                '%s: size=%d/%d hits=%d misses=%d refills=%d '
+                'average_refill_seconds=%.3f' % (
+                    metrics.type,
+                    PooledIAMUser.objects.filter(type=metrics.type).count(),
+                    PooledIAMUser.pool_size(metrics.type),
+                    metrics.hits,
+                    metrics.misses,
+                    metrics.refills,
+                    metrics.average_refill_seconds()
+                )
+            )
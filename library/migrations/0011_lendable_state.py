@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_historicalfrontpagemessage_history_change_reason'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lendable',
+            name='pending_credentials',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lendable',
+            name='state',
+            field=models.CharField(choices=[('provisioning', 'provisioning'), ('ready', 'ready'), ('failed', 'failed')], default='ready', max_length=20),
+        ),
+    ]
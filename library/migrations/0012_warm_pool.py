@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_lendable_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledIAMUser',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(db_index=True, max_length=254)),
+                ('username', models.CharField(max_length=64, unique=True)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WarmPoolMetrics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=254, unique=True)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('misses', models.PositiveIntegerField(default=0)),
+                ('refills', models.PositiveIntegerField(default=0)),
+                ('refill_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'warm pool metrics',
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_warm_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lendable',
+            name='teardown_pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:15
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_accounts(apps, schema_editor):
+    # Everything created so far lives in the default (first) AWS account
+    accounts = getattr(settings, 'AWS_ACCOUNTS', None)
+    name = accounts[0]['name'] if accounts else 'default'
+    Lendable = apps.get_model('library', 'Lendable')
+    Lendable._default_manager.filter(type='amazondemoaccount').update(account=name)
+    PooledIAMUser = apps.get_model('library', 'PooledIAMUser')
+    PooledIAMUser.objects.update(account=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_lendable_teardown_pending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lendable',
+            name='account',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='poolediamuser',
+            name='account',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(set_accounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_lendable_account'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LendableInventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=254, unique=True)),
+                ('active', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'lendable inventories',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:25
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('library', '0016_active_lendable_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LendableArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lendable_id', models.IntegerField(unique=True)),
+                ('type', models.CharField(db_index=True, max_length=254)),
+                ('checked_in_on', models.DateTimeField(db_index=True)),
+                ('checked_out_on', models.DateTimeField()),
+                ('due_on', models.DateTimeField()),
+                ('notify_timer', models.FloatField(blank=True, null=True)),
+                ('renewals', models.IntegerField(default=0)),
+                ('username', models.CharField(max_length=320)),
+                ('state', models.CharField(max_length=20)),
+                ('account', models.CharField(blank=True, default='', max_length=64)),
+                ('archived_on', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:30
+from __future__ import unicode_literals
+
+import importlib
+
+from django.db import migrations, models
+
+active_lendable_indexes = importlib.import_module(
+    'library.migrations.0016_active_lendable_indexes'
+)
+
+
+def restore_indexes(apps, schema_editor):
+    # SQLite adds and removes the column by rebuilding the table, which
+    # drops the indexes created outside of the model state.
+    if schema_editor.connection.vendor == 'sqlite':
+        active_lendable_indexes.create_indexes(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0017_lendable_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_indexes),
+        migrations.AddField(
+            model_name='lendable',
+            name='checkout_token',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(restore_indexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import importlib
+
+from django.db import migrations
+
+active_lendable_indexes = importlib.import_module(
+    'library.migrations.0016_active_lendable_indexes'
+)
+
+# Pages of the lendables of a type checked out, ordered by due date
+INDEXES = (
+    ('library_lendable_active_page', ('type', 'due_on', 'id'),
+     ('checked_in_on', None)),
+)
+
+
+def create_indexes(apps, schema_editor):
+    active_lendable_indexes.create_indexes(apps, schema_editor, INDEXES)
+
+
+def drop_indexes(apps, schema_editor):
+    active_lendable_indexes.drop_indexes(apps, schema_editor, INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0019_waitlist'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
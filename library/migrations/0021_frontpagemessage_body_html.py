@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils.html import linebreaks
+
+
+def render_bodies(apps, schema_editor):
+    FrontpageMessage = apps.get_model('library', 'FrontpageMessage')
+    for message in FrontpageMessage.objects.all():
+        FrontpageMessage.objects.filter(pk=message.pk).update(
+            body_html=linebreaks(message.body, autoescape=True)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0020_active_lendable_page_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frontpagemessage',
+            name='body_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='historicalfrontpagemessage',
+            name='body_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(render_bodies, migrations.RunPython.noop),
+    ]
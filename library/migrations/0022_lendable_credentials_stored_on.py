@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import importlib
+
+from django.db import migrations, models
+
+active_lendable_indexes = importlib.import_module(
+    'library.migrations.0016_active_lendable_indexes'
+)
+active_lendable_page_index = importlib.import_module(
+    'library.migrations.0020_active_lendable_page_index'
+)
+
+
+def restore_indexes(apps, schema_editor):
+    # SQLite adds and removes the column by rebuilding the table, which
+    # drops the indexes created outside of the model state.
+    if schema_editor.connection.vendor == 'sqlite':
+        active_lendable_indexes.create_indexes(apps, schema_editor)
+        active_lendable_page_index.create_indexes(apps, schema_editor)
+
+
+def date_pending_credentials(apps, schema_editor):
+    # Credentials of returned lendables are forgotten, those still waiting
+    # count from their checkout.
+    Lendable = apps.get_model('library', 'Lendable')
+    Lendable._default_manager.filter(
+        checked_in_on__isnull=False
+    ).update(pending_credentials=None)
+    Lendable._default_manager.filter(
+        pending_credentials__isnull=False
+    ).update(credentials_stored_on=models.F('checked_out_on'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0021_frontpagemessage_body_html'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_indexes),
+        migrations.AddField(
+            model_name='lendable',
+            name='credentials_stored_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(restore_indexes, migrations.RunPython.noop),
+        migrations.RunPython(date_pending_credentials,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 02:14
+from __future__ import unicode_literals
+
+import importlib
+
+from django.db import migrations, models
+
+active_lendable_indexes = importlib.import_module(
+    'library.migrations.0016_active_lendable_indexes'
+)
+credentials_stored_on = importlib.import_module(
+    'library.migrations.0022_lendable_credentials_stored_on'
+)
+
+# Lendables waiting for the lendable worker
+INDEXES = (
+    ('library_lendable_queued', ('checked_out_on',),
+     ('state', 'queued')),
+)
+
+
+def queue_provisioning(apps, schema_editor):
+    # Lendables left provisioning were waiting for the worker.
+    Lendable = apps.get_model('library', 'Lendable')
+    Lendable._default_manager.filter(
+        state='provisioning'
+    ).update(state='queued')
+
+
+def unqueue(apps, schema_editor):
+    Lendable = apps.get_model('library', 'Lendable')
+    Lendable._default_manager.filter(
+        state='queued'
+    ).update(state='provisioning')
+
+
+def create_indexes(apps, schema_editor):
+    active_lendable_indexes.create_indexes(apps, schema_editor, INDEXES)
+
+
+def drop_indexes(apps, schema_editor):
+    active_lendable_indexes.drop_indexes(apps, schema_editor, INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0022_lendable_credentials_stored_on'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop,
+                             credentials_stored_on.restore_indexes),
+        migrations.AlterField(
+            model_name='lendable',
+            name='state',
+            field=models.CharField(choices=[('queued', 'queued'), ('provisioning', 'provisioning'), ('ready', 'ready'), ('failed', 'failed')], default='ready', max_length=20),
+        ),
+        migrations.RunPython(credentials_stored_on.restore_indexes,
+                             migrations.RunPython.noop),
+        migrations.RunPython(queue_provisioning, unqueue),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
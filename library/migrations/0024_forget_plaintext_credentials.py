@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def forget_credentials(apps, schema_editor):
+    # Credentials used to be kept in plain text, they are encrypted now.
+    Lendable = apps.get_model('library', 'Lendable')
+    Lendable._default_manager.filter(
+        pending_credentials__isnull=False
+    ).update(pending_credentials=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0023_lendable_queued_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_credentials, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import importlib
+
+from django.db import migrations, models
+
+credentials_stored_on = importlib.import_module(
+    'library.migrations.0022_lendable_credentials_stored_on'
+)
+queued_state = importlib.import_module(
+    'library.migrations.0023_lendable_queued_state'
+)
+
+
+def restore_indexes(apps, schema_editor):
+    # SQLite adds and removes the column by rebuilding the table, which
+    # drops the indexes created outside of the model state.
+    if schema_editor.connection.vendor == 'sqlite':
+        credentials_stored_on.restore_indexes(apps, schema_editor)
+        queued_state.create_indexes(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0024_forget_plaintext_credentials'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_indexes),
+        migrations.AddField(
+            model_name='lendable',
+            name='from_waitlist',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(restore_indexes, migrations.RunPython.noop),
+    ]
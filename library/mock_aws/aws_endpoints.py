@@ -18,6 +18,7 @@
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
 
 import re
+import time
 
 from django.utils.crypto import get_random_string
 
@@ -27,7 +28,8 @@ from .aws_responses import (access_key_response, client_error,
                             list_attached_policies_response,
                             list_mfa_devices_response,
                             list_signing_certs_response,
-                            list_user_groups_response, login_profile_response,
+                            list_user_groups_response, list_users_response,
+                            login_profile_response,
                             user_response, user_group_response)
 from .constants import group_name, fake_user_name, username
 
@@ -63,6 +65,26 @@ class AWSMock(object):
         super(AWSMock, self).__init__()
         self.users = {}
         self.groups = {}
+        self.clear_faults()
+
+    def inject_faults(self, operations=None, error_code='ServiceUnavailable',
+                      status_code=503, latency=0):
+        """Make the mocked service misbehave.
+
+        Calls to the given operation names, or to every operation if None, are
+        delayed by latency seconds and then fail with error_code. Pass
+        error_code=None to only add latency.
+        """
+        self.faults = {
+            'operations': operations,
+            'error_code': error_code,
+            'status_code': status_code,
+            'latency': latency,
+        }
+
+    def clear_faults(self):
+        """Make the mocked service healthy again."""
+        self.faults = None
 
     def mock_make_api_call(self, operation_name, kwarg):
         """Entry point for mocking AWS endpoints.
@@ -72,6 +94,15 @@ class AWSMock(object):
 
         If the AWS endpoint is not mocked raise a client error.
         """
+        faults = self.faults
+        if faults and (faults['operations'] is None or
+                       operation_name in faults['operations']):
+            time.sleep(faults['latency'])
+            if faults['error_code']:
+                raise client_error(operation_name,
+                                   faults['error_code'],
+                                   'Injected fault',
+                                   faults['status_code'])
         try:
             return getattr(self, inflection(operation_name))(kwarg)
         except AttributeError:
@@ -207,6 +238,22 @@ class AWSMock(object):
         user.attached_policies.remove(policy)
         return delete_response()
 
+    def update_user(self, kwarg):
+        """Rename user if user exists and new username is free."""
+        if kwarg[username] not in self.users:
+            raise client_error('UpdateUser',
+                               '404',
+                               'User %s not found' % kwarg[username])
+        if kwarg['NewUserName'] in self.users:
+            raise client_error('UpdateUser',
+                               '409',
+                               'User %s exists' % kwarg['NewUserName'])
+
+        user = self.users.pop(kwarg[username])
+        user.username = kwarg['NewUserName']
+        self.users[user.username] = user
+        return delete_response()
+
     def get_user(self, kwarg):
         """Get user if user exists."""
         if kwarg[username] in self.users:
@@ -266,6 +313,20 @@ class AWSMock(object):
         certs = self.users[kwarg[username]].signing_certs
         return list_signing_certs_response(kwarg[username], certs)
 
+    def list_users(self, kwarg):
+        """List users in name order, one page of MaxItems at a time.
+
+        All mocked users live under the /openbare/ path.
+        """
+        if not '/openbare/'.startswith(kwarg.get('PathPrefix', '/')):
+            return list_users_response([])
+
+        names = sorted(self.users)
+        start = int(kwarg.get('Marker', 0))
+        end = start + kwarg.get('MaxItems', 100)
+        marker = str(end) if end < len(names) else None
+        return list_users_response(names[start:end], marker)
+
     def remove_user_from_group(self, kwarg):
         """Remove user from group if user exists."""
         if kwarg[username] not in self.users:
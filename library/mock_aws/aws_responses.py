@@ -24,9 +24,11 @@ from django.utils.timezone import utc
 from .constants import signing_cert
 
 
-def client_error(operation, code, message):
+def client_error(operation, code, message, status_code=None):
     """Return botocore client error instance."""
     parsed_response = {'Error': {'Code': code, 'Message': message}}
+    if status_code:
+        parsed_response['ResponseMetadata'] = {'HTTPStatusCode': status_code}
     return ClientError(parsed_response, operation)
 
 
@@ -149,6 +151,19 @@ def list_user_groups_response(groups):
     return parsed_response
 
 
+def list_users_response(usernames, marker=None):
+    """Response for list users, truncated when a marker is given."""
+    now, now_str = get_time_now()
+    parsed_response = response_metadata(now_str)
+    parsed_response['IsTruncated'] = marker is not None
+    if marker is not None:
+        parsed_response['Marker'] = marker
+    parsed_response['Users'] = [
+        user_response(username)['User'] for username in usernames
+    ]
+    return parsed_response
+
+
 def login_profile_response(username):
     """Response for list user login profiles."""
     now, now_str = get_time_now()
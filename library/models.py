@@ -17,24 +17,61 @@
 # You should have received a copy of the GNU General Public License
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
 
+import base64
+import collections
 import django
+import functools
+import hashlib
+import json
+import logging
 import re
 
 from datetime import datetime, timedelta
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.exceptions import ValidationError
+from django.core.mail import send_mail
 from django.utils.crypto import get_random_string
+from django.utils.html import linebreaks
+from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
-from library.amazon_account_utils import AmazonAccountUtils
+from library.amazon_account_utils import AmazonAccountPool
+from library.forecast import AvailabilityForecast
+from library.index_cache import index_cache
+from library.circuit_breaker import CircuitOpenError, is_service_failure
+
+from botocore.exceptions import ClientError
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from markdown_deux import markdown
 
 from unidecode import unidecode
 
 from simple_history.models import HistoricalRecords
 
+logger = logging.getLogger('django')
+
+# Email to a user a lendable was checked out to from a waitlist, see
+# WAITLIST_EMAIL_TEMPLATE in the email settings.
+WAITLIST_EMAIL_TEMPLATE = """
+Hi {firstname}!
+
+'{lendable}' became available and has been checked out to you from the
+waitlist, until '{due_on}'.
+
+Collect your credentials within {minutes} minutes at:
+{primary_url}
+
+Have a great day!
+- Your openbare Admins
+"""
+
 
 class CheckoutManager(models.Manager):
     """Override default manager to filter on checked_in_on date."""
@@ -58,7 +95,13 @@ class ProxyManager(CheckoutManager):
 
 
 class Lendable(models.Model):
-    """Lendable model that lendable resources extend from."""
+    """Lendable model that lendable resources extend from.
+
+    The partial indexes on active, queued and provisioning lendables are
+    created by raw SQL in migrations, outside of the model state. SQLite
+    drops them whenever a migration rebuilds the table, so every later
+    migration altering this model has to restore them, as 0025 does.
+    """
 
     type = models.CharField(max_length=254)
     checked_in_on = models.DateTimeField(null=True, blank=True)
@@ -68,6 +111,30 @@ class Lendable(models.Model):
     renewals = models.IntegerField(default=0)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     username = models.CharField(max_length=320)
+    state = models.CharField(
+        max_length=20,
+        choices=(
+            ('queued', _('queued')),
+            ('provisioning', _('provisioning')),
+            ('ready', _('ready')),
+            ('failed', _('failed')),
+        ),
+        default='ready'
+    )
+    # Encrypted credentials of a deferred checkout, kept until the user
+    # collects them or PENDING_CREDENTIALS_MINUTES after they were stored.
+    pending_credentials = models.TextField(null=True, blank=True)
+    credentials_stored_on = models.DateTimeField(null=True, blank=True)
+    # Set when a checked in lendable still has a resource to tear down.
+    teardown_pending = models.BooleanField(default=False)
+    # Name of the backing account for resources spread across accounts.
+    account = models.CharField(max_length=64, blank=True, default='')
+    # One-time token of the checkout request, repeated submissions of the
+    # request find the lendable it created.
+    checkout_token = models.CharField(max_length=64, null=True, blank=True,
+                                      unique=True, editable=False)
+    # Checked out from the waitlist, the user is told once it is ready.
+    from_waitlist = models.BooleanField(default=False, editable=False)
     credentials = None
 
     # The first manager assigned is the default manager for the class and its
@@ -83,51 +150,146 @@ class Lendable(models.Model):
     # checked out lendables.
     all_lendables = models.Manager()
 
+    QUEUED = 'queued'
+    PROVISIONING = 'provisioning'
+    READY = 'ready'
+    FAILED = 'failed'
+
     name = ''
     description = ''
+    # description rendered from markdown, see register_types
+    description_html = ''
     max_checked_out = 20
     lending_period_in_days = 14  # two weeks
     # six weeks total checkout - initial checkout plus two renewals
     max_renewals = 2
 
+    # Maps the type of every lendable class to the class, see register_types
+    lendable_types = collections.OrderedDict()
+    # Due dates of active lendables of every type
+    forecast = AvailabilityForecast.from_settings()
+
     def __init__(self, *args, **kwargs):
         """Initialize Lendable instance.
 
-        If lendable is an instance of a subclass set type to
-        class name.
+        If type names a registered lendable class the instance becomes
+        that class, otherwise type is set to the class name.
         """
         super(Lendable, self).__init__(*args, **kwargs)
-        subclass = [
-            x for x in self.__class__.__subclasses__() if (
-                x.__name__.lower() == self.type
-            )
-        ]
-        if subclass:
-            self.__class__ = subclass[0]
+        lendable_class = self.lendable_types.get(self.type)
+        if lendable_class:
+            if self.__class__ is not lendable_class:
+                self.__class__ = lendable_class
         else:
             self.type = self.__class__.__name__.lower()
 
+    @classmethod
+    def register_types(cls):
+        """Map the type of every subclass, direct or not, to its class.
+
+        Called once when the library app is ready. The markdown description
+        of every class is rendered then too, not on every page view.
+        """
+        types = collections.OrderedDict()
+        pending = list(cls.__subclasses__())
+        while pending:
+            subclass = pending.pop(0)
+            types[subclass.__name__.lower()] = subclass
+            subclass.description_html = mark_safe(
+                markdown(subclass.description)
+            )
+            pending.extend(subclass.__subclasses__())
+        Lendable.lendable_types = types
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Build a fetched row as the class of its type.
+
+        Every queryset of lendables is polymorphic, whatever manager or
+        class it was made from.
+        """
+        instance = super(Lendable, cls).from_db(db, field_names, values)
+        if 'type' in field_names:
+            lendable_class = cls.lendable_types.get(
+                values[field_names.index('type')]
+            )
+            if lendable_class and instance.__class__ is not lendable_class:
+                instance.__class__ = lendable_class
+        return instance
+
     def __str__(self):
         """Lendable string representation."""
         return "%s checked out by %s" % (self.name, self.user)
 
+    @classmethod
+    def expire_overdue(cls, lendable_type=None):
+        """Check in lendables past their due date.
+
+        Their inventory slots are released at once and their teardown is
+        queued for the lendable worker, so overdue lendables free capacity
+        without waiting for openbare-user-monitor. Only the first caller to
+        see a lendable overdue expires it.
+
+        Returns:
+            The number of lendables expired.
+        """
+        now = datetime.now(django.utils.timezone.utc)
+        overdue = Lendable.all_types.filter(due_on__lte=now)
+        if lendable_type:
+            overdue = overdue.filter(type=lendable_type)
+
+        expired = 0
+        for overdue_type in set(overdue.values_list('type', flat=True)):
+            with transaction.atomic():
+                count = overdue.filter(type=overdue_type).update(
+                    checked_in_on=now,
+                    pending_credentials=None,
+                    teardown_pending=True
+                )
+                LendableInventory.release(overdue_type, count)
+            index_cache.invalidate(overdue_type)
+            WaitlistEntry.fulfil(overdue_type, count)
+            expired += count
+        return expired
+
     @classmethod
     def is_available_for_user(self, user):
         """Return True if user can checkout lendable."""
+        self.expire_overdue(self.__name__.lower())
         return (
-            self.lendables.count() < self.max_checked_out and
-            self.lendables.filter(user=user).count() == 0
+            LendableInventory.count_active(self.__name__.lower()) <
+            self.max_checked_out and
+            not self.lendables.filter(user=user).exists()
         )
 
     @classmethod
-    def next_available_date(self):
-        """Return next available checkout date."""
-        try:
-            next_lendable_due = self.lendables.earliest('checked_out_on')
-        except ObjectDoesNotExist:
-            return datetime.today()
-        else:
-            return next_lendable_due.due_on
+    def active_due_dates(cls):
+        """Return (type, due_on) of every active lendable."""
+        return Lendable.all_types.values_list('type', 'due_on')
+
+    @classmethod
+    def next_available_date(cls, slots=1):
+        """Return the date slots lendables are available for checkout.
+
+        Answered from the forecast of returns, without a query while it
+        is fresh. Today if they are available now.
+        """
+        return cls.forecast.available_on(
+            cls.__name__.lower(),
+            cls.max_checked_out,
+            cls.active_due_dates,
+            slots
+        ) or datetime.now(django.utils.timezone.utc)
+
+    @classmethod
+    def expected_returns(cls, limit=5):
+        """Return (due date, lendables available) of the next returns."""
+        return cls.forecast.timeline(
+            cls.__name__.lower(),
+            cls.max_checked_out,
+            cls.active_due_dates,
+            limit
+        )
 
     def max_due_date(self):
         """Return max due date including all possible renewals."""
@@ -141,19 +303,240 @@ class Lendable(models.Model):
         return self.renewals > 0
 
     def checkin(self):
-        """Update checkin date for lenable."""
+        """Update checkin date for lenable and tear down its resource.
+
+        The checkin and the inventory release are one transaction. The
+        checkin only sets checked_in_on if it is still unset, so of
+        concurrent checkins of a lendable only the first tears it down. If
+        the backing service is unavailable or failing the teardown is
+        queued for the lendable worker instead.
+
+        Returns:
+            False if the lendable was already checked in.
+        """
         self.checked_in_on = datetime.now(django.utils.timezone.utc)
-        self.save()
+        with transaction.atomic():
+            checked_in = Lendable.all_lendables.filter(
+                pk=self.pk,
+                checked_in_on__isnull=True
+            ).update(checked_in_on=self.checked_in_on,
+                     pending_credentials=None)
+            if not checked_in:
+                return False
+            LendableInventory.release(self.type)
+        self.pending_credentials = None
+        self.forecast.record(self.type, removed=self.due_on)
+        index_cache.invalidate(self.type)
+        WaitlistEntry.fulfil(self.type)
+        try:
+            self.teardown()
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError) and \
+                    not is_service_failure(e):
+                raise
+            logger.warning('Teardown of %s queued: %s' % (self, e))
+            self.teardown_pending = True
+            self.save(update_fields=['teardown_pending'])
+        return True
 
-    def checkout(self):
-        """Initialize checked out date, due date and renewals available."""
-        if not self.is_available_for_user(self.user):
-            raise Exception('{} unavailable for checkout.'.format(self.name))
+    def teardown(self):
+        """Release the resource backing the lendable.
 
-        self._set_username()
+        Resources that provision something external extend this.
+        """
+
+    def checkout(self, defer_provisioning=False):
+        """Initialize checked out date, due date and renewals available.
+
+        A slot in the inventory of the type is taken and the lendable saved
+        in one short transaction, so concurrent checkouts can neither exceed
+        max_checked_out nor give a user two lendables of a type.
+
+        Unless defer_provisioning is set the lendable is saved in the
+        provisioning state and then provisioned, see provision_checkout, and
+        the caller hands the credentials to the user. Otherwise it is saved
+        in the queued state, for the lendable worker to provision, which
+        keeps the credentials until the user collects them.
+        """
         self.checked_out_on = datetime.now(django.utils.timezone.utc)
         self.__set_initial_due_date()
         self.renewals = settings.MAX_RENEWALS.get(self.type, self.max_renewals)
+        self.state = self.QUEUED if defer_provisioning else self.PROVISIONING
+
+        self.expire_overdue(self.type)
+        with transaction.atomic():
+            # The conditional UPDATE locks the inventory row of the type
+            # until commit, which also serializes the check for the user.
+            if not LendableInventory.acquire(self.type,
+                                             self.max_checked_out) or \
+                    Lendable.all_types.filter(type=self.type,
+                                              user=self.user).exists():
+                raise Exception(
+                    '{} unavailable for checkout.'.format(self.name)
+                )
+            self.save()
+        self.forecast.record(self.type, added=self.due_on)
+
+        if defer_provisioning:
+            return
+        self.provision_checkout()
+
+    def provision_checkout(self):
+        """Provision a lendable checked out in the provisioning state.
+
+        The provisioning state is the claim on the lendable, the lendable
+        worker only takes queued ones, so no transaction or lock is held
+        while the backing service is called. If provisioning fails the
+        checkout is aborted and the error raised.
+        """
+        try:
+            self.provision()
+        except Exception:
+            self.abort_checkout()
+            raise
+        self.finish_provisioning(keep_credentials=False)
+
+    def finish_provisioning(self, keep_credentials=True):
+        """Save the outcome of provisioning in one short UPDATE.
+
+        Unless keep_credentials is unset the credentials are kept for the
+        user to collect. A lendable checked in meanwhile is not brought
+        back, its resource is torn down instead and an error raised.
+        """
+        if keep_credentials:
+            self.keep_credentials()
+        saved = Lendable.all_types.filter(
+            pk=self.pk,
+            state=self.PROVISIONING
+        ).update(
+            state=self.state,
+            username=self.username,
+            pending_credentials=self.pending_credentials,
+            credentials_stored_on=self.credentials_stored_on
+        )
+        if not saved:
+            self.teardown()
+            raise Exception(
+                '{} was returned while it was prepared.'.format(self.name)
+            )
+        index_cache.invalidate(self.type)
+
+    def abort_checkout(self):
+        """Mark a checkout that could not be provisioned as failed.
+
+        The lendable is checked in and its inventory slot released, to the
+        next waiter if there is one.
+        """
+        with transaction.atomic():
+            self.state = self.FAILED
+            self.checked_in_on = datetime.now(django.utils.timezone.utc)
+            self.pending_credentials = None
+            self.save()
+            LendableInventory.release(self.type)
+        self.forecast.record(self.type, removed=self.due_on)
+        WaitlistEntry.fulfil(self.type)
+
+    def notify_waiter(self):
+        """Email the user a lendable checked out from a waitlist is ready."""
+        template = getattr(settings, 'WAITLIST_EMAIL_TEMPLATE',
+                           WAITLIST_EMAIL_TEMPLATE)
+        try:
+            send_mail(
+                "openbare: '%s' is checked out to you" % self.name,
+                template.format(
+                    firstname=self.user.first_name,
+                    lendable=self.name,
+                    due_on=self.due_on,
+                    primary_url=settings.PRIMARY_URL,
+                    minutes=self._pending_credentials_minutes()
+                ),
+                '%s <%s>' % (settings.ADMINS[0][0], settings.ADMINS[0][1]),
+                [self.user.email]
+            )
+        except Exception as e:
+            logger.error('Notifying %s failed: %s' % (self.user, e))
+
+    def provision(self):
+        """Set up the resource backing the lendable.
+
+        Resources that hand out credentials extend this and set
+        self.credentials.
+        """
+        self._set_username()
+        self.state = self.READY
+
+    @staticmethod
+    def _credentials_cipher():
+        """Return the cipher of kept credentials, keyed by SECRET_KEY."""
+        key = hashlib.sha256(
+            ('library.pending_credentials' + settings.SECRET_KEY).encode(
+                'utf-8'
+            )
+        ).digest()
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    @staticmethod
+    def _pending_credentials_minutes():
+        return getattr(settings, 'PENDING_CREDENTIALS_MINUTES', 10)
+
+    def keep_credentials(self):
+        """Keep the credentials, encrypted, until the user collects them."""
+        self.pending_credentials = self._credentials_cipher().encrypt(
+            json.dumps(self.credentials or {}).encode('utf-8')
+        ).decode('ascii')
+        self.credentials_stored_on = datetime.now(django.utils.timezone.utc)
+
+    @classmethod
+    def expire_pending_credentials(cls, minutes=None):
+        """Forget credentials not collected within minutes of being stored.
+
+        Defaults to PENDING_CREDENTIALS_MINUTES.
+
+        Returns:
+            The number of lendables whose credentials were forgotten.
+        """
+        if minutes is None:
+            minutes = cls._pending_credentials_minutes()
+        stale = Lendable.all_lendables.filter(
+            pending_credentials__isnull=False,
+            credentials_stored_on__lte=(
+                datetime.now(django.utils.timezone.utc) -
+                timedelta(minutes=minutes)
+            )
+        )
+        types = set(stale.values_list('type', flat=True))
+        count = stale.update(pending_credentials=None)
+        for lendable_type in types:
+            index_cache.invalidate(lendable_type)
+        return count
+
+    def pop_pending_credentials(self):
+        """Return credentials of a deferred checkout and forget them.
+
+        Returns None if there are none, they were already collected or
+        they are older than PENDING_CREDENTIALS_MINUTES.
+        """
+        with transaction.atomic():
+            pending = Lendable.all_types.select_for_update().filter(
+                pk=self.pk,
+                pending_credentials__isnull=False
+            ).values_list('pending_credentials', flat=True).first()
+            if pending is None:
+                return None
+            Lendable.all_types.filter(pk=self.pk).update(
+                pending_credentials=None
+            )
+        self.pending_credentials = None
+        index_cache.invalidate(self.type)
+        try:
+            pending = self._credentials_cipher().decrypt(
+                pending.encode('ascii'),
+                ttl=self._pending_credentials_minutes() * 60
+            )
+        except InvalidToken:
+            return None
+        return json.loads(pending.decode('utf-8'),
+                          object_pairs_hook=collections.OrderedDict)
 
     def renew(self):
         """Renew lendable.
@@ -161,16 +544,31 @@ class Lendable(models.Model):
         If renewals are available update the due_on date by adding
         another period equal to lending_period_in_days.
 
+        The renewal is a single conditional update, so concurrent renewals
+        can not renew the lendable more than max_renewals times.
+
         If no renewals available raise error and display message to user.
         """
-        if self.renewals > 0:
-            self.renewals -= 1
-            self.due_on = self.due_on + timedelta(self.lending_period_in_days)
-        else:
+        renewed = Lendable.all_types.filter(
+            pk=self.pk,
+            renewals__gt=0
+        ).update(
+            renewals=models.F('renewals') - 1,
+            due_on=models.F('due_on') + timedelta(self.lending_period_in_days)
+        )
+        if not renewed:
+            if not Lendable.all_types.filter(pk=self.pk).exists():
+                raise ValidationError(_("This item has been returned."))
             raise ValidationError(
                 _("No more renewals are available for this item.")
             )
-        return self.save()
+        self.refresh_from_db(fields=['renewals', 'due_on'])
+        self.forecast.record(
+            self.type,
+            removed=self.due_on - timedelta(self.lending_period_in_days),
+            added=self.due_on
+        )
+        index_cache.invalidate(self.type)
 
     def __set_initial_due_date(self):
         """Set due date when a lendable is checked out.
@@ -209,39 +607,145 @@ Build your customer a comprehensive PoC without touching hardware, or launch a
 hundred servers in 5 minutes for a quick experiment at scale. Amazon's public
 cloud gives you access to a massive volume of resources on-demand.
 """
-    # http://docs.aws.amazon.com/IAM/latest/UserGuide/reference_iam-limits.html
-    max_checked_out = 5000
 
     # code that interacts with AWS (via boto3) is in a separate module, so this
     # module doesn't bloat.
-    amazon_account_utils = AmazonAccountUtils(
-        settings.AWS_ACCESS_KEY_ID,
-        settings.AWS_SECRET_ACCESS_KEY
-    )
+    amazon_accounts = AmazonAccountPool.from_settings()
+    amazon_account_utils = amazon_accounts.default
+    # Each AWS account holds a limited number of IAM users
+    max_checked_out = amazon_accounts.capacity()
 
     class Meta:
         """Proxy model of model:`library.lendable`."""
 
         proxy = True
 
-    def checkout(self):
-        """Checkout a demo account using IAM credentials."""
-        super(AmazonDemoAccount, self).checkout()
-        groups = getattr(settings, 'AWS_IAM_GROUPS', [])
+    @classmethod
+    def iam_groups(cls):
+        """Return the IAM groups demo account users are joined to."""
+        groups = list(getattr(settings, 'AWS_IAM_GROUPS', []))
         # Handle deprecated setting
         default_group = getattr(settings, 'AWS_IAM_GROUP', None)
         if default_group:
             groups.append(default_group)
+        return groups
 
-        self.credentials = self.amazon_account_utils.create_iam_account(
-            self.username,
-            groups
-        )
+    @classmethod
+    def account_occupancy(cls):
+        """Return the number of IAM users in use per AWS account.
 
-    def checkin(self):
-        """Checkin demo account and clean up AWS resources."""
-        super(AmazonDemoAccount, self).checkin()
-        self.amazon_account_utils.destroy_iam_account(self.username)
+        Checked in lendables still queued for teardown keep their IAM user
+        until the lendable worker deletes it, so they are counted too.
+        """
+        occupancy = collections.Counter()
+        lendable_type = cls.__name__.lower()
+        for queryset in (cls.lendables.all(),
+                         Lendable.all_lendables.filter(
+                             type=lendable_type, teardown_pending=True),
+                         PooledIAMUser.objects.filter(type=lendable_type)):
+            for row in queryset.order_by().values('account').annotate(
+                    count=Count('pk')):
+                if row['account'] in cls.amazon_accounts.accounts:
+                    occupancy[row['account']] += row['count']
+                else:
+                    occupancy[cls.amazon_accounts.default.name] += \
+                        row['count']
+        return occupancy
+
+    @classmethod
+    def in_account(cls, utils):
+        """Return a filter of the rows living in the AWS account of utils.
+
+        Rows without an account, or of an account no longer configured,
+        live in the default account, see AmazonAccountPool.get.
+        """
+        in_account = models.Q(account=utils.name)
+        if utils is cls.amazon_accounts.default:
+            in_account |= ~models.Q(
+                account__in=list(cls.amazon_accounts.accounts)
+            )
+        return in_account
+
+    @property
+    def account_utils(self):
+        """Return utils of the AWS account the demo account lives in."""
+        return self.amazon_accounts.get(self.account)
+
+    def provision(self):
+        """Create the IAM user backing the demo account.
+
+        A user from the warm pool of the account is claimed if one is
+        available, otherwise a new user is created.
+
+        Called outside of any transaction, see provision_checkout. A pooled
+        user keeps the creation date it was pooled with, so the claim of the
+        pooled user and the username are committed before the user is
+        renamed, or reconcile_iam could take the renamed user for an orphan.
+        Committing the claim also keeps a pooled user that is renamed but
+        then deleted out of the pool for good.
+        """
+        super(AmazonDemoAccount, self).provision()
+
+        utils = self.account_utils
+        release = functools.partial(PooledIAMUser.release, self.type,
+                                    account=utils.name)
+        with transaction.atomic():
+            pool_username = PooledIAMUser.claim(self.type, utils.name)
+            if pool_username:
+                Lendable.all_lendables.filter(pk=self.pk).update(
+                    username=self.username
+                )
+        if pool_username:
+            try:
+                self.credentials = utils.claim_pool_account(
+                    pool_username,
+                    self.username,
+                    release
+                )
+                return
+            except CircuitOpenError:
+                # Nothing was changed in IAM
+                release(pool_username)
+                raise
+            except Exception as e:
+                utils.log(e, logging.ERROR)
+
+        try:
+            self.credentials = utils.create_iam_account(
+                self.username,
+                self.iam_groups()
+            )
+        except ClientError as e:
+            # The username index only covers the openbare path, so the
+            # name may still be taken elsewhere in the account.
+            if e.response['Error']['Code'] != 'EntityAlreadyExists':
+                raise
+            self.username = get_random_string(length=20)
+            self.credentials = utils.create_iam_account(
+                self.username,
+                self.iam_groups()
+            )
+
+    def checkout(self, defer_provisioning=False):
+        """Checkout a demo account in the least loaded AWS account.
+
+        Fails fast while AWS is down.
+        """
+        utils = self.amazon_accounts.choose(self.account_occupancy)
+        if utils is None:
+            raise Exception('{} unavailable for checkout.'.format(self.name))
+
+        self.account = utils.name
+        try:
+            super(AmazonDemoAccount, self).checkout(defer_provisioning)
+        except Exception:
+            self.amazon_accounts.record(utils.name, -1)
+            raise
+
+    def teardown(self):
+        """Clean up and delete the IAM user."""
+        self.account_utils.destroy_iam_account(self.username)
+        self.amazon_accounts.record(self.account_utils.name, -1)
 
     def _set_username(self):
         """Normalize username to remove none ascii chars and validate."""
@@ -251,7 +755,7 @@ cloud gives you access to a massive volume of resources on-demand.
         # a new username. Lendable must be available for checkout by user
         # to hit this code.
         if not self._validate_username() or \
-                self.amazon_account_utils.iam_user_exists(self.username):
+                self.account_utils.iam_user_exists(self.username):
             self.username = get_random_string(length=20)
 
     def _validate_username(self):
@@ -264,6 +768,339 @@ cloud gives you access to a massive volume of resources on-demand.
             65 > len(self.username) > 1
 
 
+class PooledIAMUser(models.Model):
+    """IAM user created ahead of checkout, waiting to be claimed."""
+
+    type = models.CharField(max_length=254, db_index=True)
+    username = models.CharField(max_length=64, unique=True)
+    account = models.CharField(max_length=64, blank=True, default='')
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """Pooled IAM user string representation."""
+        return self.username
+
+    @classmethod
+    def pool_size(cls, lendable_type):
+        """Return the configured warm pool size for the lendable type."""
+        return getattr(settings, 'WARM_POOL_SIZE', {}).get(lendable_type, 0)
+
+    @classmethod
+    def claim(cls, lendable_type, account=''):
+        """Atomically take a pooled user of the given type and account.
+
+        Deleting the row is the claim, so two checkouts never get the same
+        user.
+
+        Returns:
+            The username of the claimed IAM user or None.
+        """
+        if not cls.pool_size(lendable_type):
+            return None
+
+        candidates = cls.objects.filter(
+            type=lendable_type,
+            account=account
+        ).order_by('created_on').values_list('pk', 'username')[:5]
+        for pk, username in candidates:
+            deleted, _rows = cls.objects.filter(pk=pk).delete()
+            if deleted:
+                WarmPoolMetrics.record(lendable_type, hits=1)
+                return username
+
+        WarmPoolMetrics.record(lendable_type, misses=1)
+        return None
+
+    @classmethod
+    def release(cls, lendable_type, username, account=''):
+        """Put a claimed user that was left untouched back in the pool."""
+        cls.objects.get_or_create(
+            username=username,
+            defaults={'type': lendable_type, 'account': account}
+        )
+
+
+class LendableArchive(models.Model):
+    """Lendable returned long ago, moved out of the active table.
+
+    Credentials are never archived.
+    """
+
+    lendable_id = models.IntegerField(unique=True)
+    type = models.CharField(max_length=254, db_index=True)
+    checked_in_on = models.DateTimeField(db_index=True)
+    checked_out_on = models.DateTimeField()
+    due_on = models.DateTimeField()
+    notify_timer = models.FloatField(null=True, blank=True)
+    renewals = models.IntegerField(default=0)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    username = models.CharField(max_length=320)
+    state = models.CharField(max_length=20)
+    account = models.CharField(max_length=64, blank=True, default='')
+    archived_on = models.DateTimeField(auto_now_add=True)
+
+    # Lendable fields copied to the archive
+    copied_fields = (
+        'type', 'checked_in_on', 'checked_out_on', 'due_on', 'notify_timer',
+        'renewals', 'user_id', 'username', 'state', 'account'
+    )
+
+    def __str__(self):
+        """Archived lendable string representation."""
+        return '%s checked out by %s' % (self.type, self.user)
+
+    @classmethod
+    def archivable(cls, days):
+        """Return lendables checked in more than days ago.
+
+        Lendables still waiting for their teardown are kept.
+        """
+        return Lendable.all_lendables.filter(
+            checked_in_on__lt=datetime.now(django.utils.timezone.utc) -
+            timedelta(days=days),
+            teardown_pending=False
+        )
+
+    @classmethod
+    def archive_batch(cls, days, batch_size):
+        """Move up to batch_size archivable lendables in one transaction.
+
+        Returns:
+            The number of lendables archived.
+        """
+        with transaction.atomic():
+            rows = list(
+                cls.archivable(days).select_for_update(
+                    skip_locked=True
+                ).order_by('pk').values('pk', *cls.copied_fields)[:batch_size]
+            )
+            if not rows:
+                return 0
+            pks = [row.pop('pk') for row in rows]
+            cls.objects.bulk_create(
+                cls(lendable_id=pk, **row) for pk, row in zip(pks, rows)
+            )
+            Lendable.all_lendables.filter(pk__in=pks).delete()
+        return len(rows)
+
+
+class WaitlistEntry(models.Model):
+    """User waiting for a lendable type to become available.
+
+    Waiters are served first come, first served: whenever a lendable of the
+    type is returned the oldest waiter gets it checked out. It is
+    provisioned by the lendable worker, which tells the waiter by email, so
+    waitlists are only served with ASYNC_CHECKOUT.
+    """
+
+    type = models.CharField(max_length=254)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    joined_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('type', 'user')
+        verbose_name_plural = 'waitlist entries'
+
+    def __str__(self):
+        """Waitlist entry string representation."""
+        return '%s waiting for %s' % (self.user, self.type)
+
+    @classmethod
+    def join(cls, lendable_type, user):
+        """Add user to the waitlist of a type, if not on it already.
+
+        Returns:
+            The position of the user on the waitlist.
+        """
+        entry, created = cls.objects.get_or_create(
+            type=lendable_type,
+            user=user
+        )
+        return cls.objects.filter(type=lendable_type, pk__lte=entry.pk).count()
+
+    @classmethod
+    def positions(cls, user):
+        """Return the position of user on each waitlist, by type."""
+        ahead = cls.objects.filter(
+            type=models.OuterRef('type'),
+            pk__lte=models.OuterRef('pk')
+        ).order_by().values('type').annotate(
+            position=Count('pk')
+        ).values('position')
+        return dict(
+            cls.objects.filter(user=user).annotate(
+                position=models.Subquery(ahead,
+                                         output_field=models.IntegerField())
+            ).values_list('type', 'position')
+        )
+
+    @classmethod
+    def fulfil(cls, lendable_type, slots=1):
+        """Check out lendables of a type to the longest waiting users.
+
+        Waiters who meanwhile got a lendable of the type are dropped. Stops
+        when slots lendables are checked out or none is available. The
+        lendables are only queued for the lendable worker, so the request
+        or sweep freeing them never provisions them nor sends mail. Does
+        nothing without ASYNC_CHECKOUT, as no worker would provision them.
+
+        Returns:
+            The checked out lendables.
+        """
+        fulfilled = []
+        if not getattr(settings, 'ASYNC_CHECKOUT', False):
+            return fulfilled
+        while len(fulfilled) < slots:
+            try:
+                with transaction.atomic():
+                    entry = cls.objects.select_for_update(
+                        skip_locked=True
+                    ).filter(type=lendable_type).order_by('pk').first()
+                    if not entry:
+                        break
+                    entry.delete()
+                    if Lendable.all_types.filter(type=lendable_type,
+                                                 user=entry.user_id).exists():
+                        continue
+                    lendable = Lendable(type=lendable_type, user=entry.user,
+                                        from_waitlist=True)
+                    lendable.checkout(defer_provisioning=True)
+            except Exception:
+                # Unavailable after all, the waiter keeps the place.
+                break
+            fulfilled.append(lendable)
+        return fulfilled
+
+
+class LendableInventory(models.Model):
+    """Number of active checkouts of a lendable type.
+
+    Kept in step with Lendable by checkout and checkin, in the same
+    transactions, so admission doesn't count the lendables table.
+    """
+
+    type = models.CharField(max_length=254, unique=True)
+    active = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'lendable inventories'
+
+    def __str__(self):
+        """Lendable inventory string representation."""
+        return '%s: %d active' % (self.type, self.active)
+
+    @classmethod
+    def _ensure(cls, lendable_type):
+        """Create the counter of a type, counting its lendables once."""
+        if not cls.objects.filter(type=lendable_type).exists():
+            try:
+                with transaction.atomic():
+                    cls.objects.create(
+                        type=lendable_type,
+                        active=Lendable.all_types.filter(
+                            type=lendable_type
+                        ).count()
+                    )
+            except IntegrityError:
+                # Created by a concurrent checkout
+                pass
+
+    @classmethod
+    def count_active(cls, lendable_type):
+        """Return the number of active checkouts of a type."""
+        cls._ensure(lendable_type)
+        return cls.objects.values_list('active', flat=True).get(
+            type=lendable_type
+        )
+
+    @classmethod
+    def acquire(cls, lendable_type, limit):
+        """Take a slot if fewer than limit are active.
+
+        Call inside a transaction; the row stays locked until it ends.
+
+        Returns:
+            True if a slot was taken.
+        """
+        cls._ensure(lendable_type)
+        return cls.objects.filter(
+            type=lendable_type,
+            active__lt=limit
+        ).update(active=models.F('active') + 1) == 1
+
+    @classmethod
+    def release(cls, lendable_type, count=1):
+        """Give back count slots of a type."""
+        if count:
+            cls.objects.filter(type=lendable_type).update(
+                active=Greatest(models.F('active') - count, 0)
+            )
+
+    @classmethod
+    def rebuild(cls, dry_run=False):
+        """Recount the active lendables of every type.
+
+        Unless dry_run is set wrong counters are corrected.
+
+        Returns:
+            A dict of type to (stored, actual) for the counters that were
+            wrong.
+        """
+        repaired = {}
+        with transaction.atomic():
+            stored = dict(
+                cls.objects.select_for_update().values_list('type', 'active')
+            )
+            actual = dict(
+                Lendable.all_types.order_by().values_list('type').annotate(
+                    Count('pk')
+                )
+            )
+            for lendable_type in set(stored) | set(actual):
+                counts = (stored.get(lendable_type),
+                          actual.get(lendable_type, 0))
+                if counts[0] == counts[1]:
+                    continue
+                repaired[lendable_type] = counts
+                if dry_run:
+                    continue
+                cls.objects.update_or_create(
+                    type=lendable_type,
+                    defaults={'active': counts[1]}
+                )
+        return repaired
+
+
+class WarmPoolMetrics(models.Model):
+    """Counters for the warm pool of a lendable type."""
+
+    type = models.CharField(max_length=254, unique=True)
+    hits = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+    refills = models.PositiveIntegerField(default=0)
+    refill_seconds = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'warm pool metrics'
+
+    def __str__(self):
+        """Warm pool metrics string representation."""
+        return 'Warm pool metrics for %s' % self.type
+
+    @classmethod
+    def record(cls, lendable_type, **increments):
+        """Add increments to the counters of the lendable type."""
+        cls.objects.get_or_create(type=lendable_type)
+        cls.objects.filter(type=lendable_type).update(**{
+            field: models.F(field) + value
+            for field, value in increments.items()
+        })
+
+    def average_refill_seconds(self):
+        """Return the mean time it took to add a user to the pool."""
+        return self.refill_seconds / self.refills if self.refills else 0
+
+
 class FrontpageMessage(models.Model):
     rank = models.IntegerField(
         default=0,
@@ -273,9 +1110,16 @@ class FrontpageMessage(models.Model):
     )
     title = models.CharField(max_length=254, blank=False)
     body = models.TextField(blank=False)
+    # body rendered as HTML paragraphs, see save
+    body_html = models.TextField(blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True, db_index=True)
     history = HistoricalRecords()
 
     class Meta:
         ordering = ['rank', '-updated_at']
+
+    def save(self, *args, **kwargs):
+        """Render the body once, not on every page view."""
+        self.body_html = linebreaks(self.body, autoescape=True)
+        super(FrontpageMessage, self).save(*args, **kwargs)
@@ -0,0 +1,293 @@
+"""Host wide rate limiting of AWS API calls."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# Error codes AWS uses when it throttles a caller.
+THROTTLE_CODES = (
+    'Throttling',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+)
+
+logger = logging.getLogger('django')
+
+_local = threading.local()
+
+
+def current_priority():
+    """Return the priority of AWS calls made by the current thread."""
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(value):
+    """Make AWS calls in the block with the given priority.
+
+    Background sweeps wrap their work in priority(BACKGROUND) so they yield
+    to checkouts made by users.
+    """
+    previous = current_priority()
+    _local.priority = value
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class FileTokenBucket:
+    """Token bucket shared by all processes on a host through a state file.
+
+    The bucket state is a small JSON document guarded by an exclusive
+    flock. The refill rate is adaptive: it is halved whenever AWS throttles
+    a call and creeps back up towards the configured rate on success.
+    Background callers may not take the last background_reserve share of
+    the burst, which is kept for interactive callers.
+    """
+
+    def __init__(self, path, rate, burst=None, min_rate=None,
+                 background_reserve=0.5, mode=0o600):
+        """Initialize bucket stored at path allowing rate calls a second.
+
+        The state file is created with the given mode.
+        """
+        self.path = path
+        self.mode = mode
+        self.max_rate = float(rate)
+        self.burst = float(burst or rate)
+        self.min_rate = float(min_rate or self.max_rate / 20)
+        self.background_reserve = background_reserve
+        self._disabled = False
+
+    def _transact(self, update):
+        """Apply update to the shared state while holding the file lock."""
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL,
+                         self.mode)
+            # Not narrowed by the umask, other users may have to share it
+            os.fchmod(fd, self.mode)
+        except FileExistsError:
+            fd = os.open(self.path, os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), 'r+') as state_file:
+                try:
+                    state = json.loads(state_file.read())
+                except ValueError:
+                    state = {
+                        'tokens': self.burst,
+                        'rate': self.max_rate,
+                        'updated': time.time()
+                    }
+                result = update(state)
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(state))
+            return result
+        finally:
+            os.close(fd)
+
+    def _refill(self, state):
+        now = time.time()
+        state['tokens'] = min(
+            self.burst,
+            state['tokens'] + (now - state['updated']) * state['rate']
+        )
+        state['updated'] = now
+
+    def _take(self, state, floor):
+        self._refill(state)
+        if state['tokens'] - 1 >= floor:
+            state['tokens'] -= 1
+            return 0
+        return (floor + 1 - state['tokens']) / state['rate']
+
+    def _run(self, update):
+        if self._disabled:
+            return None
+        try:
+            return self._transact(update)
+        except OSError as e:
+            # Never fail AWS calls because the limiter can't keep state.
+            logger.error('Rate limiting disabled for %s: %s' % (
+                self.path, e
+            ))
+            self._disabled = True
+            return None
+
+    def acquire(self, caller_priority=None):
+        """Block until a token is available for the caller's priority."""
+        caller_priority = caller_priority or current_priority()
+        floor = 0
+        if caller_priority == BACKGROUND:
+            floor = self.burst * self.background_reserve
+
+        while True:
+            wait = self._run(lambda state: self._take(state, floor))
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def throttled(self):
+        """Halve the rate after AWS throttled a call."""
+        def update(state):
+            self._refill(state)
+            state['rate'] = max(self.min_rate, state['rate'] / 2)
+            state['tokens'] = min(state['tokens'], 0)
+        self._run(update)
+
+    def succeeded(self):
+        """Widen the rate again after a successful call."""
+        def update(state):
+            self._refill(state)
+            state['rate'] = min(
+                self.max_rate,
+                state['rate'] + self.max_rate / 100
+            )
+        self._run(update)
+
+    def rate(self):
+        """Return the current refill rate."""
+        return self._run(lambda state: state['rate'])
+
+
+def private_directory():
+    """Return a directory in the temporary directory only we can use.
+
+    Returns None if it exists but belongs to another user or is open to
+    others, who could then starve or unthrottle our calls.
+    """
+    directory = os.path.join(
+        tempfile.gettempdir(),
+        'openbare-%d' % os.getuid()
+    )
+    try:
+        os.makedirs(directory, 0o700, exist_ok=True)
+        status = os.lstat(directory)
+    except OSError as e:
+        logger.error('Rate limiting disabled: %s' % e)
+        return None
+    if status.st_uid != os.getuid() or status.st_mode & 0o077:
+        logger.error(
+            'Rate limiting disabled: %s is not private, set '
+            'AWS_RATE_LIMIT_DIR' % directory
+        )
+        return None
+    return directory
+
+
+def shared_directory():
+    """Return AWS_RATE_LIMIT_DIR, creating it if needed.
+
+    The directory is shared by the web server and cron, so it is created
+    writable by its group. Returns None if the setting is unset.
+
+    Raises:
+        ImproperlyConfigured: The directory can't be created or written to.
+    """
+    directory = getattr(settings, 'AWS_RATE_LIMIT_DIR', None)
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, 0o770, exist_ok=True)
+    except OSError as e:
+        raise ImproperlyConfigured(
+            'AWS_RATE_LIMIT_DIR %s can not be created: %s' % (directory, e)
+        )
+    if not os.access(directory, os.W_OK | os.X_OK):
+        raise ImproperlyConfigured(
+            'AWS_RATE_LIMIT_DIR %s is not writable' % directory
+        )
+    return directory
+
+
+def get_iam_bucket(aws_access_key_id):
+    """Return the IAM token bucket for an access key.
+
+    IAM throttles per account, so every process using the same key shares
+    one state file, in AWS_RATE_LIMIT_DIR or else a private directory of
+    the user. Returns None if rate limiting is disabled.
+
+    Raises:
+        ImproperlyConfigured: AWS_RATE_LIMIT_DIR is not usable.
+    """
+    rate = getattr(settings, 'AWS_IAM_RATE_LIMIT', 10)
+    if not rate:
+        return None
+
+    mode = 0o660
+    directory = shared_directory()
+    if not directory:
+        mode = 0o600
+        directory = private_directory()
+    if not directory:
+        return None
+    key = hashlib.sha1(
+        (aws_access_key_id or '').encode('utf-8')
+    ).hexdigest()[:12]
+    return FileTokenBucket(
+        os.path.join(directory, 'openbare-iam-%s.json' % key),
+        rate,
+        burst=getattr(settings, 'AWS_IAM_RATE_LIMIT_BURST', None),
+        background_reserve=getattr(
+            settings,
+            'AWS_IAM_BACKGROUND_RESERVE',
+            0.5
+        ),
+        mode=mode
+    )
+
+
+def install(client, bucket):
+    """Rate limit every request sent by a boto3 IAM client through bucket.
+
+    botocore retries throttled calls itself, so every attempt takes a token
+    and reports its outcome, not only the call as a whole.
+    """
+    def before_send(**kwargs):
+        bucket.acquire()
+
+    def needs_retry(response=None, **kwargs):
+        if response is None:
+            # The request failed without an answer from AWS
+            return
+        http_response, parsed = response
+        code = (parsed or {}).get('Error', {}).get('Code')
+        if code in THROTTLE_CODES:
+            bucket.throttled()
+        elif not code:
+            bucket.succeeded()
+
+    client.meta.events.register('before-send.iam', before_send)
+    client.meta.events.register('needs-retry.iam', needs_retry)
@@ -0,0 +1,59 @@
+"""Signal receivers of library app."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+from django.db.models.signals import post_delete, post_save
+
+from library.index_cache import index_cache
+from library.models import FrontpageMessage, Lendable, WaitlistEntry
+
+
+def lendable_changed(sender, instance, **kwargs):
+    """Drop the cached home page context of the lendable type."""
+    index_cache.invalidate(instance.type)
+
+
+def lendable_deleted(sender, instance, **kwargs):
+    """Drop a deleted active lendable from the cache and the forecast."""
+    if instance.checked_in_on is None:
+        index_cache.invalidate(instance.type)
+        Lendable.forecast.record(instance.type, removed=instance.due_on)
+
+
+def waitlist_changed(sender, instance, **kwargs):
+    """Drop the cached home page context of the waitlisted type."""
+    index_cache.invalidate(instance.type)
+
+
+def frontpage_message_changed(sender, instance, **kwargs):
+    """Drop the cached frontpage messages."""
+    index_cache.invalidate('frontpage')
+
+
+def connect():
+    """Connect the receivers, once the lendable types are registered."""
+    # Signals are sent by the concrete class saved, every lendable type
+    # is connected.
+    for lendable_class in [Lendable] + list(Lendable.lendable_types.values()):
+        post_save.connect(lendable_changed, sender=lendable_class)
+        post_delete.connect(lendable_deleted, sender=lendable_class)
+    for signal in (post_save, post_delete):
+        signal.connect(waitlist_changed, sender=WaitlistEntry)
+        signal.connect(frontpage_message_changed, sender=FrontpageMessage)
+        signal.connect(frontpage_message_changed,
+                       sender=FrontpageMessage.history.model)
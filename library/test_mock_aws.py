@@ -33,6 +33,25 @@ class AWSMockTestCase(TestCase):
         self.kwarg = {username: 'John',
                       group_name: 'Admins'}
 
+    def test_list_users(self):
+        """Test users are listed in pages."""
+        for name in ['carol', 'alice', 'bob']:
+            self.mocker.create_user({username: name})
+
+        page = self.mocker.list_users({'MaxItems': 2})
+        self.assertTrue(page['IsTruncated'])
+        self.assertEqual([user[username] for user in page['Users']],
+                         ['alice', 'bob'])
+
+        page = self.mocker.list_users({'MaxItems': 2,
+                                       'Marker': page['Marker']})
+        self.assertFalse(page['IsTruncated'])
+        self.assertEqual([user[username] for user in page['Users']],
+                         ['carol'])
+
+        page = self.mocker.list_users({'PathPrefix': '/other/'})
+        self.assertEqual(page['Users'], [])
+
     def test_unmocked_operation(self):
         """Test operation not mocked error is returned."""
         msg = 'An error occurred (500) when calling the CreateGecko ' \
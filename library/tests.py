@@ -17,21 +17,55 @@
 # You should have received a copy of the GNU General Public License
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
 
+import json
+import os
+import tempfile
+import threading
+import time
+
+from datetime import datetime, timedelta
+from io import StringIO
 from unittest.mock import patch
 
+from botocore.awsrequest import AWSResponse
+
 from django.contrib.auth.models import AnonymousUser, User
 from django.core import mail
-from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.urlresolvers import reverse
-from django.test import Client, RequestFactory, TestCase
-
-from library.models import AmazonDemoAccount, Lendable, FrontpageMessage
+from django.db import OperationalError, connection, transaction
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase)
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from library.availability import AvailabilitySnapshot
+from library.forecast import TypeForecast
+from library.index_cache import IndexContextCache, index_cache
+from library.models import (AmazonDemoAccount, Lendable, FrontpageMessage,
+                            LendableArchive, LendableInventory,
+                            PooledIAMUser, WaitlistEntry, WarmPoolMetrics)
+from library.templatetags import formatting_filters
 from library.views import (get_items_checked_out_by, get_lendable_resources,
                            IndexView)
-
-from library.amazon_account_utils import AmazonAccountUtils
+from library.worker import (provision_pending, refill_warm_pool,
+                            teardown_pending)
+
+from library import rate_limiter
+from library.amazon_account_utils import (AmazonAccountPool,
+                                          AmazonAccountUtils,
+                                          IAMClientAccountUtils,
+                                          connection_cache, get_engine)
 from library.mock_aws.aws_endpoints import AWSMock
+from library.mock_aws.aws_responses import client_error
 from library.mock_aws.constants import fake_user_name
+from openbare import checks
+
+
+def checkout_data():
+    """Return the POST data of a new checkout request."""
+    return {'checkout_token': get_random_string(32)}
 
 
 class LibraryTestCase(TestCase):
@@ -44,6 +78,13 @@ class LibraryTestCase(TestCase):
         self.user = User.objects.create_user(username="user1",
                                              email="user1@openbare.com",
                                              password="str0ngpa$$w0rd")
+        Lendable.forecast.invalidate()
+        index_cache.cache.clear()
+        index_cache.reset_stats()
+        # The test cache is per process, which disables the index cache
+        patcher = patch.object(index_cache, 'ttl', 60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_index(self):
         """Test index view."""
@@ -55,6 +96,70 @@ class LibraryTestCase(TestCase):
         self.assertContains(response, 'Log in', status_code=200)
         self.assertContains(response, '<h2>Welcome!</h2>', status_code=200)
 
+    def test_anonymous_page_cache(self):
+        """Test the page of anonymous users is cached and revalidated."""
+        FrontpageMessage.objects.create(title='Welcome', body='Hello')
+        response = self.c.get(reverse('library:index'))
+        self.assertContains(response, 'Hello')
+        self.assertIn('Cookie', response['Vary'])
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.c.get(reverse('library:index'))
+        self.assertContains(response, 'Hello')
+        with self.assertNumQueries(0):
+            response = self.c.get(reverse('library:index'),
+                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Changing a message changes the page
+        message = FrontpageMessage.objects.get()
+        message.body = 'Goodbye'
+        message.save()
+        response = self.c.get(reverse('library:index'),
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Goodbye')
+        self.assertNotEqual(response['ETag'], etag)
+
+        # So does deleting one, back to the page without messages
+        etag = response['ETag']
+        message.delete()
+        response = self.c.get(reverse('library:index'),
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertNotContains(response, 'Goodbye')
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Pages with a message for the user are not cached
+        response = self.c.get(reverse('library:checkout',
+                                      args=['lendable']),
+                              follow=True)
+        self.assertContains(response, 'Permission denied')
+        response = self.c.get(reverse('library:index'))
+        self.assertNotContains(response, 'Permission denied')
+
+    def test_rendered_html(self):
+        """Test descriptions and messages are rendered ahead of time."""
+        self.assertIn('<p>Build your customer',
+                      AmazonDemoAccount.description_html)
+        message = FrontpageMessage.objects.create(
+            title='Maintenance',
+            body='Down <b>today</b>.\n\nBack tomorrow.'
+        )
+        self.assertEqual(
+            message.body_html,
+            '<p>Down &lt;b&gt;today&lt;/b&gt;.</p>\n\n<p>Back tomorrow.</p>'
+        )
+        self.assertContains(self.c.get(reverse('library:index')),
+                            message.body_html,
+                            html=True)
+
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        self.assertContains(self.c.get(reverse('library:index')),
+                            AmazonDemoAccount.description_html,
+                            html=True)
+
     def test_require_login(self):
         """Test login required to perform lendable actions."""
         for view in ['library:checkout', 'library:renew',
@@ -69,9 +174,10 @@ class LibraryTestCase(TestCase):
         self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
 
         # Test check out lendable
-        response = self.c.get(reverse('library:checkout',
-                                      args=['lendable']),
-                              follow=True)
+        response = self.c.post(reverse('library:checkout',
+                                       args=['lendable']),
+                               checkout_data(),
+                               follow=True)
 
         self.assertContains(response, 'is checked out to you',
                             status_code=200)
@@ -147,9 +253,10 @@ class LibraryTestCase(TestCase):
         with patch.object(Lendable,
                           'checkout',
                           side_effect=Exception('Checkout Failed!')):
-            response = self.c.get(reverse('library:checkout',
-                                          args=['lendable']),
-                                  follow=True)
+            response = self.c.post(reverse('library:checkout',
+                                           args=['lendable']),
+                                   checkout_data(),
+                                   follow=True)
 
         # Confirm error message displayed
         message = list(response.context['messages'])[0].message
@@ -172,6 +279,428 @@ class LibraryTestCase(TestCase):
             resources))
         self.assertEqual(len(aws), 1)
 
+    def test_lendable_types(self):
+        """Test fetched rows are built as the class of their type."""
+        self.assertIs(Lendable.lendable_types['amazondemoaccount'],
+                      AmazonDemoAccount)
+        self.assertIsInstance(Lendable(type='amazondemoaccount'),
+                              AmazonDemoAccount)
+        self.assertEqual(Lendable().type, 'lendable')
+
+        due_on = datetime.now(timezone.utc)
+        created = AmazonDemoAccount.lendables.create(user=self.user,
+                                                     username='john',
+                                                     due_on=due_on)
+        Lendable.all_types.create(user=self.user, due_on=due_on)
+
+        lendables = list(Lendable.all_types.order_by('pk'))
+        self.assertEqual([type(lendable) for lendable in lendables],
+                         [AmazonDemoAccount, Lendable])
+        self.assertEqual(lendables[0], created)
+        self.assertEqual(lendables[0].username, 'john')
+        self.assertEqual(lendables[0].due_on, due_on)
+        self.assertFalse(lendables[0]._state.adding)
+
+        # Partial rows take the regular path
+        lendable = Lendable.all_types.only('type', 'username').get(
+            pk=created.pk
+        )
+        self.assertIsInstance(lendable, AmazonDemoAccount)
+        self.assertEqual(lendable.due_on, due_on)
+
+        out = StringIO()
+        call_command('benchmark_lendables', '--rows=10', '--repeat=1',
+                     stdout=out)
+        self.assertEqual(
+            [line.split()[0] for line in out.getvalue().splitlines()],
+            ['method', 'registry', 'scan']
+        )
+
+    def test_availability_snapshot(self):
+        """Test availability of every type is worked out in one query."""
+        other = User.objects.create_user(username='user2')
+        now = datetime.now(timezone.utc)
+        for user, days in [(self.user, 3), (other, 1)]:
+            AmazonDemoAccount.lendables.create(
+                user=user,
+                username=user.username,
+                due_on=now + timedelta(days=days)
+            )
+
+        with self.assertNumQueries(1):
+            availability = AvailabilitySnapshot(self.user)
+        self.assertEqual(availability.for_type(AmazonDemoAccount), (2, 1))
+        self.assertFalse(
+            availability.is_available_for_user(AmazonDemoAccount)
+        )
+        self.assertEqual(
+            AmazonDemoAccount.expected_returns(),
+            [(now + timedelta(days=1), AmazonDemoAccount.max_checked_out - 1),
+             (now + timedelta(days=3), AmazonDemoAccount.max_checked_out)]
+        )
+        self.assertEqual(availability.for_type(Lendable), (0, 0))
+        self.assertTrue(AvailabilitySnapshot(
+            User.objects.create_user(username='user3')
+        ).is_available_for_user(AmazonDemoAccount))
+
+        # The home page makes the same queries for any number of types,
+        # while the forecast of returns is fresh
+        with self.assertNumQueries(2):
+            resources = get_lendable_resources(self.user)
+        self.assertEqual(resources[0]['checked_out_count'], 2)
+
+    def test_index_cache_shared(self):
+        """Test the index cache is only enabled on a shared backend."""
+        self.assertEqual(IndexContextCache.from_settings().ttl, 0)
+        with self.settings(INDEX_CACHE_TTL=30):
+            self.assertEqual(IndexContextCache.from_settings().ttl, 30)
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            CACHES={'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory
+            }}
+        ):
+            self.assertEqual(IndexContextCache.from_settings().ttl, 60)
+
+    def test_index_cache(self):
+        """Test the home page context is cached until it changes."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        other = User.objects.create_user(username='user2')
+        now = datetime.now(timezone.utc)
+
+        def resource(response):
+            return response.context['resources'][0]
+
+        first = self.c.get(reverse('library:index'))
+        self.assertEqual(resource(first)['checked_out_count'], 0)
+        self.assertEqual(index_cache.stats()['hits'], 0)
+
+        second = self.c.get(reverse('library:index'))
+        self.assertEqual(index_cache.stats(), {
+            'hits': index_cache.stats()['misses'],
+            'misses': index_cache.stats()['misses']
+        })
+        self.assertNotEqual(resource(first)['checkout_token'],
+                            resource(second)['checkout_token'])
+
+        # Saving a lendable of the type drops it
+        lendable = AmazonDemoAccount.lendables.create(
+            user=other,
+            username=other.username,
+            due_on=now + timedelta(days=1),
+            renewals=1
+        )
+        # Created without checkout, which keeps the forecast up to date
+        Lendable.forecast.invalidate()
+        response = self.c.get(reverse('library:index'))
+        self.assertEqual(resource(response)['checked_out_count'], 1)
+        self.assertEqual(resource(response)['expected_returns'][0][0],
+                         lendable.due_on)
+
+        # So do renewals and checkins, which do not save the lendable
+        lendable.renew()
+        response = self.c.get(reverse('library:index'))
+        self.assertEqual(resource(response)['expected_returns'][0][0],
+                         lendable.due_on)
+        with patch.object(AmazonDemoAccount, 'teardown'):
+            lendable.checkin()
+        response = self.c.get(reverse('library:index'))
+        self.assertEqual(resource(response)['checked_out_count'], 0)
+
+        # And changes to the frontpage messages
+        anonymous = Client()
+        self.assertNotContains(anonymous.get(reverse('library:index')),
+                               'Maintenance')
+        FrontpageMessage.objects.create(title='Maintenance', body='Soon')
+        self.assertContains(anonymous.get(reverse('library:index')),
+                            'Maintenance')
+
+        response = self.c.get(reverse('library:index_cache_status'))
+        self.assertEqual(response.status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.c.get(reverse('library:index_cache_status'))
+        self.assertEqual(response.json(), index_cache.stats())
+
+    @patch.object(IndexContextCache, 'shared', True)
+    def test_user_etag(self):
+        """Test the page of a user is revalidated with an ETag."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        response = self.c.get(reverse('library:index'))
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+
+        # Only the session and the user are loaded
+        with self.assertNumQueries(2):
+            response = self.c.get(reverse('library:index'),
+                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Any lendable of a type shown changes the page
+        other = User.objects.create_user(username='user2')
+        AmazonDemoAccount.lendables.create(
+            user=other,
+            username=other.username,
+            due_on=datetime.now(timezone.utc) + timedelta(days=1)
+        )
+        response = self.c.get(reverse('library:index'),
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # So does time, availability changes with it
+        etag = response['ETag']
+        with patch('library.views.time.time',
+                   return_value=time.time() + index_cache.ttl):
+            response = self.c.get(reverse('library:index'),
+                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # And so does another user
+        other.set_password('str0ngpa$$w0rd')
+        other.save()
+        self.c.login(username=other.username, password='str0ngpa$$w0rd')
+        response = self.c.get(reverse('library:index'),
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_etag_unshared(self):
+        """Test no ETag is sent while the cache is per process."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        response = self.c.get(reverse('library:index'))
+        self.assertNotIn('ETag', response)
+
+    def test_checked_out_pages(self):
+        """Test lendables checked out are listed a page at a time."""
+        due_on = datetime.now(timezone.utc) + timedelta(days=1)
+        users = [User.objects.create_user(username='user%d' % i)
+                 for i in range(2, 7)]
+        # Lendables due at the same time are ordered by primary key
+        for user, days in zip(users, [2, 0, 1, 0, 0]):
+            AmazonDemoAccount.lendables.create(
+                user=user,
+                username=user.username,
+                due_on=due_on + timedelta(days=days)
+            )
+
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        url = reverse('library:checked_out', args=['amazondemoaccount'])
+        pages = []
+        with patch('library.views.CHECKED_OUT_PAGE_SIZE', 2):
+            while url:
+                data = self.c.get(url).json()
+                pages.append([item['user'] for item in data['items']])
+                url = data['next']
+        self.assertEqual(pages, [['user3', 'user5'], ['user6', 'user4'],
+                                 ['user2']])
+        self.assertEqual(
+            data['items'][0]['due_on'],
+            formatting_filters.format_date(due_on + timedelta(days=2))
+        )
+
+        response = self.c.get(reverse('library:checked_out',
+                                      args=['amazondemoaccount']),
+                              {'after': 'yesterday,1'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_forecast(self):
+        """Test the forecast of returns follows checkouts and checkins."""
+        now = datetime.now(timezone.utc)
+        days = [now + timedelta(days=i) for i in range(4)]
+        forecast = TypeForecast([days[3], days[1], days[2]])
+        self.assertIsNone(forecast.available_on(4))
+        self.assertEqual(forecast.available_on(3), days[1])
+        self.assertEqual(forecast.available_on(3, slots=2), days[2])
+        with self.assertRaises(ValueError):
+            forecast.available_on(3, slots=4)
+        self.assertEqual(forecast.timeline(4, 2), [(days[1], 2), (days[2], 3)])
+        forecast.drop_overdue(days[1])
+        self.assertEqual(forecast.due_dates, [days[2], days[3]])
+
+        other = User.objects.create_user(username='user2')
+        with patch.object(Lendable, 'max_checked_out', 2):
+            first = Lendable(user=self.user)
+            first.checkout()
+            self.assertLess(Lendable.next_available_date(), first.due_on)
+
+            # Kept up to date without querying
+            second = Lendable(user=other)
+            second.checkout()
+            second.renew()
+            with self.assertNumQueries(0):
+                self.assertEqual(Lendable.next_available_date(),
+                                 first.due_on)
+                self.assertEqual(Lendable.next_available_date(slots=2),
+                                 second.due_on)
+            first.renew()
+            first.renew()
+            with self.assertNumQueries(0):
+                self.assertEqual(Lendable.next_available_date(),
+                                 second.due_on)
+                self.assertEqual(Lendable.next_available_date(slots=2),
+                                 first.due_on)
+            second.checkin()
+            with self.assertNumQueries(0):
+                self.assertLess(Lendable.next_available_date(),
+                                first.due_on)
+                self.assertEqual(Lendable.expected_returns(),
+                                 [(first.due_on, 2)])
+
+            # Deleting an active lendable, e.g. in the admin, returns it
+            with patch.object(index_cache, 'invalidate') as invalidate:
+                Lendable.all_types.get(pk=first.pk).delete()
+            invalidate.assert_called_once_with('lendable')
+            with self.assertNumQueries(0):
+                self.assertEqual(Lendable.expected_returns(), [])
+
+    def test_lendable_inventory(self):
+        """Test checkout admission through the inventory counters."""
+        other = User.objects.create_user(username='user2')
+        lendable = Lendable(user=self.user)
+        lendable.checkout()
+        self.assertEqual(LendableInventory.count_active('lendable'), 1)
+
+        # One lendable of a type per user
+        with self.assertRaisesRegex(Exception, 'unavailable'):
+            Lendable(user=self.user).checkout()
+        self.assertEqual(LendableInventory.count_active('lendable'), 1)
+
+        # No more than max_checked_out
+        with patch.object(Lendable, 'max_checked_out', 1):
+            self.assertFalse(Lendable.is_available_for_user(other))
+            with self.assertRaisesRegex(Exception, 'unavailable'):
+                Lendable(user=other).checkout()
+        self.assertEqual(Lendable.all_types.count(), 1)
+
+        # Only the first checkin gives the slot back
+        lendable.checkin()
+        lendable.checkin()
+        self.assertEqual(LendableInventory.count_active('lendable'), 0)
+        self.assertTrue(Lendable.is_available_for_user(other))
+
+        # Failed provisioning releases the slot
+        with patch.object(Lendable, 'provision', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                Lendable(user=other).checkout()
+        self.assertEqual(LendableInventory.count_active('lendable'), 0)
+        self.assertEqual(
+            Lendable.all_lendables.filter(state=Lendable.FAILED).count(), 1
+        )
+
+        # Counters that drifted are repaired from the lendables
+        Lendable(user=other).checkout()
+        LendableInventory.objects.update(active=5)
+        out = StringIO()
+        call_command('repair_inventory', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue(), 'lendable: counter 5, 1 active\n')
+        call_command('repair_inventory', stdout=StringIO())
+        self.assertEqual(LendableInventory.count_active('lendable'), 1)
+        out = StringIO()
+        call_command('repair_inventory', stdout=out)
+        self.assertIn('All inventory counters are correct', out.getvalue())
+
+    def test_lazy_expiry(self):
+        """Test overdue lendables free their slot on the next request."""
+        other = User.objects.create_user(username='user2')
+        Lendable(user=self.user).checkout()
+        lendable = Lendable.all_types.get()
+        Lendable.all_types.update(
+            due_on=datetime.now(timezone.utc) - timedelta(1)
+        )
+
+        # Overdue lendables are left out and expired by the first look
+        availability = AvailabilitySnapshot(other)
+        self.assertEqual(availability.for_type(Lendable).active, 0)
+        self.assertGreater(availability.next_available_date(Lendable),
+                           datetime.now(timezone.utc) - timedelta(1))
+        self.assertEqual(Lendable.all_types.count(), 0)
+        self.assertEqual(LendableInventory.count_active('lendable'), 0)
+        self.assertEqual(Lendable.expire_overdue(), 0)
+
+        with patch.object(Lendable, 'max_checked_out', 1):
+            self.assertTrue(Lendable.is_available_for_user(other))
+            Lendable(user=other).checkout()
+
+        # The teardown is left to the lendable worker, yielding to users
+        lendable = Lendable.all_lendables.get(pk=lendable.pk)
+        self.assertTrue(lendable.teardown_pending)
+        priorities = []
+        with patch.object(
+            Lendable, 'teardown',
+            side_effect=lambda: priorities.append(
+                rate_limiter.current_priority()
+            )
+        ):
+            self.assertEqual(teardown_pending(), 1)
+        self.assertEqual(priorities, [rate_limiter.BACKGROUND])
+        self.assertFalse(
+            Lendable.all_lendables.get(pk=lendable.pk).teardown_pending
+        )
+
+    def test_archive_lendables(self):
+        """Test returned lendables are moved to the archive in batches."""
+        now = datetime.now(timezone.utc)
+        for i in range(5):
+            lendable = Lendable(user=self.user)
+            lendable.checkout()
+            lendable.checkin()
+        Lendable.all_lendables.update(checked_in_on=now - timedelta(100))
+        # Active, recently returned and awaiting teardown lendables stay
+        Lendable(user=self.user).checkout()
+        lendable = Lendable.all_lendables.first()
+        Lendable.all_lendables.filter(pk=lendable.pk).update(
+            teardown_pending=True
+        )
+        recent = Lendable(user=self.user)
+        recent.checked_in_on = now - timedelta(10)
+        recent.checked_out_on = recent.due_on = now - timedelta(20)
+        recent.save()
+
+        out = StringIO()
+        call_command('archive_lendables', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue(), '4 lendables to archive\n')
+        self.assertEqual(LendableArchive.objects.count(), 0)
+
+        out = StringIO()
+        call_command('archive_lendables', '--batch-size', '3', stdout=out)
+        self.assertEqual(out.getvalue(), '4 lendables archived\n')
+        self.assertEqual(LendableArchive.objects.count(), 4)
+        self.assertEqual(Lendable.all_lendables.count(), 3)
+        self.assertFalse(Lendable.all_lendables.filter(
+            pk__in=LendableArchive.objects.values('lendable_id')
+        ).exists())
+        archive = LendableArchive.objects.first()
+        self.assertEqual(archive.user, self.user)
+        self.assertEqual(archive.type, 'lendable')
+
+        # Archived lendables are read only in the admin
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        url = reverse('admin:library_lendablearchive_changelist')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        url = reverse('admin:library_lendablearchive_add')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_explain_queries(self):
+        """Test the hot lendable queries are answered from indexes."""
+        out = StringIO()
+        call_command('explain_queries', '--check', stdout=out)
+        self.assertIn('checkout admission', out.getvalue())
+        self.assertNotIn('full scan', out.getvalue())
+
+    def test_partial_indexes(self):
+        """Test the indexes created outside of the model state survive."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, 'library_lendable'
+            )
+        for name in ('active_type', 'active_user', 'active_due',
+                     'provisioning', 'teardown', 'active_page', 'queued'):
+            self.assertIn('library_lendable_%s' % name, constraints)
+
     def test_get_items_checked_out_by(self):
         """Test get_items_checked_out_by method."""
         lendables = get_items_checked_out_by(None)
@@ -200,6 +729,12 @@ class AWSTestCase(TestCase):
                                              email="user1@openbare.com",
                                              password="str0ngpa$$w0rd")
         self.aws_account = AmazonDemoAccount(user=self.user)
+        AmazonDemoAccount.amazon_accounts.invalidate()
+        Lendable.forecast.invalidate()
+        index_cache.cache.clear()
+        for utils in AmazonDemoAccount.amazon_accounts.accounts.values():
+            utils.username_index.invalidate()
+            utils.breaker.reset()
 
     def test_validate_username(self):
         """Test validate username method."""
@@ -258,9 +793,10 @@ class AWSTestCase(TestCase):
             with patch('botocore.client.BaseClient._make_api_call',
                        new=mocker.mock_make_api_call):
                 # Test check out AWS lendable
-                response = self.c.get(reverse('library:checkout',
-                                              args=['amazondemoaccount']),
-                                      follow=True)
+                response = self.c.post(reverse('library:checkout',
+                                               args=['amazondemoaccount']),
+                                       checkout_data(),
+                                       follow=True)
 
         # Get lendable and parse due date string
         aws_lendable = self.user.lendable_set.first()
@@ -281,9 +817,10 @@ class AWSTestCase(TestCase):
         self.assertEqual(Lendable.all_types.count(), 1)
 
         # Test user cannot checkout AWS account twice
-        response = self.c.get(reverse('library:checkout',
-                                      args=['amazondemoaccount']),
-                              follow=True)
+        response = self.c.post(reverse('library:checkout',
+                                       args=['amazondemoaccount']),
+                               checkout_data(),
+                               follow=True)
 
         # Confirm error message displayed
         message = list(response.context['messages'])[0].message
@@ -328,6 +865,352 @@ class AWSTestCase(TestCase):
 
         mocker.delete_group({'GroupName': 'Admins'})
 
+    def test_checkout_replay(self):
+        """Test a repeated checkout request provisions only once."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        mocker = AWSMock()
+        mocker.create_group({'GroupName': 'Admins'})
+        calls = []
+
+        def counting_api_call(client, operation_name, kwarg):
+            calls.append(operation_name)
+            return mocker.mock_make_api_call(operation_name, kwarg)
+
+        url = reverse('library:checkout', args=['amazondemoaccount'])
+        data = checkout_data()
+        with self.settings(AWS_IAM_GROUPS=['Admins']):
+            with patch('botocore.client.BaseClient._make_api_call',
+                       new=counting_api_call):
+                # GET requests, such as prefetches, check nothing out
+                self.c.get(url)
+                self.assertEqual(Lendable.all_lendables.count(), 0)
+
+                # Credentials are shown in the response, not stored
+                response = self.c.post(url, data)
+                self.assertEqual(calls.count('CreateUser'), 1)
+                self.assertContains(response, '<code>John</code>')
+                self.assertContains(response, 'is checked out to you')
+                self.assertIsNone(
+                    Lendable.all_lendables.get().pending_credentials
+                )
+
+                response = self.c.post(url, data, follow=True)
+
+        self.assertEqual(calls.count('CreateUser'), 1)
+        self.assertEqual(Lendable.all_lendables.count(), 1)
+        self.assertNotContains(response, '<code>John</code>')
+        self.assertContains(response, 'its credentials were shown')
+
+    def test_waitlist(self):
+        """Test returned lendables go to the longest waiting user."""
+        mocker = AWSMock()
+        mocker.create_group({'GroupName': 'Admins'})
+        join_url = reverse('library:join_waitlist', args=['amazondemoaccount'])
+        clients = []
+        waiters = [
+            User.objects.create_user(username='waiter%d' % i,
+                                     email='waiter%d@openbare.com' % i,
+                                     password='str0ngpa$$w0rd')
+            for i in range(2)
+        ]
+
+        # Without the lendable worker there are no waitlists
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        response = self.c.post(join_url, follow=True)
+        self.assertContains(response, 'Waitlists are not available')
+        self.assertEqual(WaitlistEntry.objects.count(), 0)
+
+        with self.settings(ASYNC_CHECKOUT=True, AWS_IAM_GROUPS=['Admins'],
+                           ADMINS=[('Admin', 'admin@openbare.com')]), \
+                patch.object(AmazonDemoAccount, 'max_checked_out', 1), \
+                patch('botocore.client.BaseClient._make_api_call',
+                      new=mocker.mock_make_api_call):
+            self.c.post(reverse('library:checkout',
+                                args=['amazondemoaccount']),
+                        checkout_data())
+            self.assertEqual(provision_pending(), 1)
+            lendable = self.user.lendable_set.get()
+
+            for waiter in waiters:
+                client = Client()
+                client.login(username=waiter.username,
+                             password='str0ngpa$$w0rd')
+                response = client.post(join_url, follow=True)
+                clients.append(client)
+            self.assertContains(response, 'number 2 on the waitlist')
+
+            # Joining again keeps the place
+            clients[0].post(join_url)
+            self.assertEqual(WaitlistEntry.positions(waiters[0]),
+                             {'amazondemoaccount': 1})
+
+            # Leaving gives it up
+            clients[1].post(reverse('library:leave_waitlist',
+                                    args=['amazondemoaccount']))
+            self.assertEqual(WaitlistEntry.positions(waiters[1]), {})
+            clients[1].post(join_url)
+
+            # The checkin only queues the first waiter's lendable, the
+            # lendable worker provisions it and sends the email
+            calls = []
+            with patch.object(AmazonDemoAccount, 'provision',
+                              side_effect=calls.append):
+                self.c.get(reverse('library:checkin', args=[lendable.pk]))
+            self.assertEqual(calls, [])
+            fulfilled = waiters[0].lendable_set.get()
+            self.assertEqual(fulfilled.state, Lendable.QUEUED)
+            self.assertEqual(len(mail.outbox), 0)
+            self.assertEqual(WaitlistEntry.positions(waiters[0]), {})
+            self.assertEqual(WaitlistEntry.positions(waiters[1]),
+                             {'amazondemoaccount': 1})
+            self.assertEqual(provision_pending(), 1)
+            self.assertEqual(len(mail.outbox), 1)
+            self.assertEqual(mail.outbox[0].to, [waiters[0].email])
+            self.assertIn('within 10 minutes', mail.outbox[0].body)
+            self.assertCollects(clients[0], fulfilled, 'waiter0')
+
+            # The next waiter is not told about a lendable that failed
+            clients[0].get(reverse('library:checkin', args=[fulfilled.pk]))
+            fulfilled = waiters[1].lendable_set.get()
+            self.assertEqual(fulfilled.state, Lendable.QUEUED)
+            with patch.object(AmazonDemoAccount, 'provision',
+                              side_effect=Exception('IAM unavailable')):
+                self.assertEqual(provision_pending(), 0)
+            fulfilled = Lendable.all_lendables.get(pk=fulfilled.pk)
+            self.assertEqual(fulfilled.state, Lendable.FAILED)
+            self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(WaitlistEntry.objects.count(), 0)
+
+    def assertCollects(self, client, lendable, username):
+        """Assert the home page links the credentials of the lendable."""
+        credentials_url = reverse('library:credentials', args=[lendable.pk])
+        response = client.get(reverse('library:index'))
+        self.assertContains(response, 'Collect credentials')
+        self.assertContains(response, credentials_url)
+        response = client.post(credentials_url, follow=True)
+        self.assertContains(response, '<code>%s</code>' % username)
+
+    def test_async_checkout(self):
+        """Test deferred checkout provisioned by the lendable worker."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        mocker = AWSMock()
+        mocker.create_group({'GroupName': 'Admins'})
+
+        with self.settings(ASYNC_CHECKOUT=True, AWS_IAM_GROUPS=['Admins']):
+            with patch('botocore.client.BaseClient._make_api_call',
+                       new=mocker.mock_make_api_call):
+                response = self.c.post(reverse('library:checkout',
+                                               args=['amazondemoaccount']),
+                                       checkout_data(),
+                                       follow=True)
+
+                # Nothing is created in IAM until the worker runs
+                self.assertEqual(mocker.users, {})
+                self.assertContains(response, 'is being prepared for you')
+                lendable = self.user.lendable_set.get()
+                self.assertEqual(lendable.state, Lendable.QUEUED)
+                self.assertContains(
+                    response,
+                    reverse('library:status', args=[lendable.pk])
+                )
+
+                status_url = reverse('library:status', args=[lendable.pk])
+                self.assertEqual(self.c.get(status_url).json(),
+                                 {'state': 'queued'})
+
+                self.assertEqual(provision_pending(), 1)
+                self.assertIn('John', mocker.users)
+
+        credentials_url = reverse('library:credentials', args=[lendable.pk])
+        response = self.c.get(reverse('library:index'))
+        self.assertContains(response, 'Collect credentials')
+        self.assertContains(response, credentials_url)
+        self.assertEqual(
+            self.c.get(status_url).json(),
+            {'state': 'ready', 'credentials_url': credentials_url}
+        )
+
+        # GET requests, such as link unfurls, leave them alone
+        response = self.c.get(credentials_url, follow=True)
+        self.assertNotContains(response, '<code>John</code>')
+        self.assertIsNotNone(Lendable.all_types.get().pending_credentials)
+
+        # Credentials are presented exactly once
+        response = self.c.post(credentials_url, follow=True)
+        self.assertContains(response, '<code>John</code>')
+        self.assertIsNone(Lendable.all_types.get().pending_credentials)
+
+        response = self.c.post(credentials_url, follow=True)
+        self.assertNotContains(response, '<code>John</code>')
+        self.assertContains(response, 'have already been collected')
+        self.assertEqual(self.c.get(status_url).json(), {'state': 'ready'})
+        self.assertNotContains(self.c.get(reverse('library:index')),
+                               'Collect credentials')
+
+    def test_pending_credentials_expire(self):
+        """Test uncollected credentials are encrypted and forgotten."""
+        def provision(lendable):
+            lendable.state = Lendable.READY
+            lendable.credentials = {'Secret Access Key': 'sekrit'}
+
+        with patch.object(Lendable, 'provision', autospec=True,
+                          side_effect=provision):
+            Lendable(user=self.user).checkout(defer_provisioning=True)
+            provision_pending()
+        lendable = Lendable.all_types.get()
+        self.assertNotIn('sekrit', lendable.pending_credentials)
+        self.assertIsNotNone(lendable.credentials_stored_on)
+
+        pending = lendable.pending_credentials
+        self.assertEqual(Lendable.expire_pending_credentials(), 0)
+        self.assertEqual(lendable.pop_pending_credentials(),
+                         {'Secret Access Key': 'sekrit'})
+
+        Lendable.all_types.update(pending_credentials=pending)
+        self.assertEqual(Lendable.expire_pending_credentials(minutes=0), 1)
+        self.assertIsNone(lendable.pop_pending_credentials())
+
+        # Returning the lendable forgets them too
+        Lendable.all_types.update(pending_credentials=pending)
+        lendable.checkin()
+        self.assertFalse(Lendable.all_lendables.filter(
+            pending_credentials__isnull=False
+        ).exists())
+
+    def test_async_checkout_failure(self):
+        """Test failed deferred checkout releases the lendable."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        mocker = AWSMock()
+
+        with self.settings(ASYNC_CHECKOUT=True, AWS_IAM_GROUPS=['Admins']):
+            with patch('botocore.client.BaseClient._make_api_call',
+                       new=mocker.mock_make_api_call):
+                self.c.post(reverse('library:checkout',
+                                    args=['amazondemoaccount']),
+                            checkout_data())
+                self.assertEqual(provision_pending(), 0)
+
+        lendable = Lendable.all_lendables.get()
+        self.assertEqual(lendable.state, Lendable.FAILED)
+        self.assertIsNotNone(lendable.checked_in_on)
+        self.assertEqual(mocker.users, {})
+
+        response = self.c.get(reverse('library:status', args=[lendable.pk]))
+        self.assertEqual(response.json()['state'], 'failed')
+
+    def test_warm_pool_checkout(self):
+        """Test checkout claims a pooled IAM user when one is available."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        mocker = AWSMock()
+        mocker.create_group({'GroupName': 'Admins'})
+
+        with self.settings(WARM_POOL_SIZE={'amazondemoaccount': 2},
+                           AWS_IAM_GROUPS=['Admins']):
+            with patch('botocore.client.BaseClient._make_api_call',
+                       new=mocker.mock_make_api_call):
+                self.assertEqual(refill_warm_pool(), 2)
+                self.assertEqual(refill_warm_pool(), 0)
+                self.assertEqual(len(mocker.users), 2)
+                pooled = PooledIAMUser.objects.order_by('created_on').first()
+                self.assertIsNone(mocker.users[pooled.username].password)
+                self.assertIn('Admins', mocker.users[pooled.username].groups)
+
+                response = self.c.post(reverse('library:checkout',
+                                               args=['amazondemoaccount']),
+                                       checkout_data(),
+                                       follow=True)
+
+        self.assertContains(response, '<code>John</code>')
+        self.assertEqual(PooledIAMUser.objects.count(), 1)
+        self.assertNotIn(pooled.username, mocker.users)
+        self.assertIsNotNone(mocker.users['John'].password)
+        self.assertEqual(len(mocker.users['John'].access_keys), 1)
+        self.assertIn('Admins', mocker.users['John'].groups)
+
+        metrics = WarmPoolMetrics.objects.get(type='amazondemoaccount')
+        self.assertEqual((metrics.hits, metrics.misses, metrics.refills),
+                         (1, 0, 2))
+
+        # A pooled user that can not be renamed as the name is taken goes
+        # back to the pool, the username is committed first so reconcile_iam
+        # does not take it for an orphan
+        with patch('botocore.client.BaseClient._make_api_call',
+                   new=mocker.mock_make_api_call):
+            self.assertTrue(AmazonDemoAccount.lendables.get().checkin())
+        pooled = PooledIAMUser.objects.get()
+        stored = []
+
+        def rename(username, new_username):
+            stored.append(AmazonDemoAccount.lendables.values_list(
+                'username', flat=True
+            ).get())
+            raise client_error('UpdateUser', 'EntityAlreadyExists', 'Taken')
+
+        utils_class = type(AmazonDemoAccount.amazon_accounts.default)
+        with self.settings(WARM_POOL_SIZE={'amazondemoaccount': 2},
+                           AWS_IAM_GROUPS=['Admins']):
+            with patch('botocore.client.BaseClient._make_api_call',
+                       new=mocker.mock_make_api_call), \
+                    patch.object(utils_class, '_rename_iam_user',
+                                 side_effect=rename):
+                response = self.c.post(reverse('library:checkout',
+                                               args=['amazondemoaccount']),
+                                       checkout_data(),
+                                       follow=True)
+        self.assertContains(response, '<code>John</code>')
+        self.assertEqual(stored, ['John'])
+        self.assertEqual(
+            list(PooledIAMUser.objects.values_list('username', 'account')),
+            [(pooled.username, pooled.account)]
+        )
+        self.assertIn(pooled.username, mocker.users)
+
+        # An empty pool falls back to creating the user and counts a miss
+        PooledIAMUser.objects.all().delete()
+        with self.settings(WARM_POOL_SIZE={'amazondemoaccount': 2}):
+            self.assertIsNone(PooledIAMUser.claim('amazondemoaccount'))
+        metrics.refresh_from_db()
+        self.assertEqual(metrics.misses, 1)
+
+    def test_warm_pool_claim_failures(self):
+        """Test pooled users that were changed never go back to the pool."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        mocker = AWSMock()
+        mocker.create_group({'GroupName': 'Admins'})
+        utils_class = type(AmazonDemoAccount.amazon_accounts.default)
+        checkout_url = reverse('library:checkout', args=['amazondemoaccount'])
+
+        with self.settings(WARM_POOL_SIZE={'amazondemoaccount': 1},
+                           AWS_IAM_GROUPS=['Admins']), \
+                patch('botocore.client.BaseClient._make_api_call',
+                      new=mocker.mock_make_api_call):
+            # Access can not be granted after the rename, the renamed user
+            # is deleted and its pool row stays gone
+            refill_warm_pool()
+            pooled = PooledIAMUser.objects.get()
+            with patch.object(utils_class, '_create_access_key',
+                              side_effect=client_error('CreateAccessKey',
+                                                       'LimitExceeded',
+                                                       'Too many keys')):
+                self.c.post(checkout_url, checkout_data())
+            self.assertEqual(Lendable.all_lendables.get().state,
+                             Lendable.FAILED)
+            self.assertFalse(PooledIAMUser.objects.exists())
+            self.assertNotIn(pooled.username, mocker.users)
+            self.assertNotIn('John', mocker.users)
+
+            # A pooled user deleted behind our back is not put back either
+            refill_warm_pool()
+            pooled = PooledIAMUser.objects.get()
+            del mocker.users[pooled.username]
+            response = self.c.post(checkout_url, checkout_data(),
+                                   follow=True)
+            self.assertContains(response, '<code>John</code>')
+            self.assertFalse(PooledIAMUser.objects.exists())
+
+        metrics = WarmPoolMetrics.objects.get(type='amazondemoaccount')
+        self.assertEqual((metrics.hits, metrics.refills), (2, 2))
+
     def test_checkout_group_exception(self):
         mocker = AWSMock()
         self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
@@ -337,9 +1220,10 @@ class AWSTestCase(TestCase):
                    new=mocker.mock_make_api_call):
             with self.settings(AWS_IAM_GROUPS=['Admins'],
                                AWS_ACCOUNT_ID_ALIAS=None):
-                response = self.c.get(reverse('library:checkout',
-                                              args=['amazondemoaccount']),
-                                      follow=True)
+                response = self.c.post(reverse('library:checkout',
+                                               args=['amazondemoaccount']),
+                                       checkout_data(),
+                                       follow=True)
 
         # Confirm error message displayed
         message = list(response.context['messages'])[0].message
@@ -364,9 +1248,10 @@ class AWSTestCase(TestCase):
             with patch.object(AmazonAccountUtils,
                               '_cleanup_iam_user',
                               return_value=True):
-                response = self.c.get(reverse('library:checkout',
-                                              args=['amazondemoaccount']),
-                                      follow=True)
+                response = self.c.post(reverse('library:checkout',
+                                               args=['amazondemoaccount']),
+                                       checkout_data(),
+                                       follow=True)
 
         # Confirm error message displayed
         message = list(response.context['messages'])[0].message
@@ -399,6 +1284,617 @@ class AWSTestCase(TestCase):
 
         self.assertFalse(result)
 
+    def test_destroy_account_teardown(self):
+        """Test every dependent resource is removed before the user."""
+        mocker = AWSMock()
+        mocker.create_group({'GroupName': 'Admins'})
+        calls = []
+
+        def mock_make_api_call(client, operation_name, kwarg):
+            calls.append(operation_name)
+            return mocker.mock_make_api_call(operation_name, kwarg)
+
+        amazon_account_utils = AmazonAccountUtils(
+            '43543253245',
+            '6543654rfdfds'
+        )
+        with patch('botocore.client.BaseClient._make_api_call',
+                   new=mock_make_api_call):
+            amazon_account_utils.create_iam_account('john', ['Admins'])
+            user = mocker.users['john']
+            user.mfa_devices.extend(['mfa-1', 'mfa-2'])
+            user.signing_certs.append('cert-1')
+            user.attached_policies.append('ReadOnlyAccess')
+
+            del calls[:]
+            result = amazon_account_utils.destroy_iam_account('john')
+
+        self.assertTrue(result)
+        self.assertNotIn('john', mocker.users)
+        self.assertEqual(calls[:2], ['GetUser', 'DeleteLoginProfile'])
+        self.assertEqual(calls[-1], 'DeleteUser')
+        for operation in ['DeleteAccessKey', 'DeactivateMFADevice',
+                          'DeleteSigningCertificate', 'RemoveUserFromGroup',
+                          'DetachUserPolicy']:
+            self.assertIn(operation, calls)
+        self.assertEqual(calls.count('DeactivateMFADevice'), 2)
+
+    def test_checkin_teardown_failure(self):
+        """Test a teardown failing on a service error is queued."""
+        lendable = AmazonDemoAccount.lendables.create(
+            user=self.user,
+            username='john',
+            due_on=datetime.now(timezone.utc) + timedelta(days=1)
+        )
+        with patch.object(AmazonDemoAccount, 'teardown',
+                          side_effect=client_error('DeleteUser',
+                                                   'ServiceFailure',
+                                                   'Down', 500)):
+            self.assertTrue(lendable.checkin())
+        self.assertTrue(
+            Lendable.all_lendables.get(pk=lendable.pk).teardown_pending
+        )
+
+        # Errors caused by the lendable itself are raised
+        lendable = AmazonDemoAccount.lendables.create(
+            user=self.user,
+            username='jane',
+            due_on=datetime.now(timezone.utc) + timedelta(days=1)
+        )
+        with patch.object(AmazonDemoAccount, 'teardown',
+                          side_effect=ValueError('broken')):
+            with self.assertRaises(ValueError):
+                lendable.checkin()
+        self.assertFalse(
+            Lendable.all_lendables.get(pk=lendable.pk).teardown_pending
+        )
+
+    def test_client_engine(self):
+        """Test the IAM client engine against the resource engine API."""
+        mocker = AWSMock()
+        mocker.create_group({'GroupName': 'Admins'})
+        utils = get_engine('client')('43543253245', '6543654rfdfds')
+        self.assertIsInstance(utils, IAMClientAccountUtils)
+
+        with patch('botocore.client.BaseClient._make_api_call',
+                   new=mocker.mock_make_api_call):
+            self.assertFalse(utils.iam_user_exists('john'))
+            credentials = utils.create_iam_account('john', ['Admins'])
+            self.assertTrue(utils.iam_user_exists('john'))
+            self.assertIn('Admins', mocker.users['john'].groups)
+            self.assertEqual(credentials['Username'], 'john')
+            self.assertEqual(mocker.users['john'].password,
+                             credentials['Password'])
+            self.assertIn(credentials['Access Key ID'],
+                          mocker.users['john'].access_keys)
+
+            utils.create_pool_account('pooled', ['Admins'])
+            credentials = utils.claim_pool_account('pooled', 'jane')
+            self.assertEqual(credentials['Username'], 'jane')
+            self.assertNotIn('pooled', mocker.users)
+
+            self.assertTrue(utils.destroy_iam_account('john'))
+            self.assertFalse(utils.destroy_iam_account('john'))
+            self.assertFalse(utils.iam_user_exists('john'))
+
+        self.assertEqual(sorted(mocker.users), ['jane'])
+        with self.assertRaises(ImproperlyConfigured):
+            get_engine('soap')
+
+        out = StringIO()
+        call_command('benchmark_iam', '--iterations=2', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:2] for line in lines[1:]],
+                         [['client', '29'], ['resource', '29']])
+
+    def test_username_index(self):
+        """Test name collisions are checked against the local index."""
+        mocker = AWSMock()
+        mocker.create_user({'UserName': 'john'})
+        calls = []
+
+        def mock_make_api_call(client, operation_name, kwarg):
+            calls.append(operation_name)
+            return mocker.mock_make_api_call(operation_name, kwarg)
+
+        amazon_account_utils = AmazonAccountUtils(
+            '43543253245',
+            '6543654rfdfds'
+        )
+        with patch('botocore.client.BaseClient._make_api_call',
+                   new=mock_make_api_call):
+            # IAM usernames are case insensitive
+            self.assertTrue(amazon_account_utils.iam_user_exists('John'))
+            self.assertFalse(amazon_account_utils.iam_user_exists('jane'))
+            self.assertEqual(calls, ['ListUsers'])
+
+            amazon_account_utils.create_iam_account('jane')
+            self.assertTrue(amazon_account_utils.iam_user_exists('jane'))
+            amazon_account_utils.destroy_iam_account('john')
+            self.assertFalse(amazon_account_utils.iam_user_exists('john'))
+            self.assertEqual(calls.count('ListUsers'), 1)
+            self.assertNotIn('GetUser', calls[:calls.index('CreateUser')])
+
+            # A stale index is synced again
+            mocker.create_user({'UserName': 'bob'})
+            self.assertFalse(amazon_account_utils.iam_user_exists('bob'))
+            amazon_account_utils.username_index.invalidate()
+            self.assertTrue(amazon_account_utils.iam_user_exists('bob'))
+            self.assertEqual(calls.count('ListUsers'), 2)
+
+    def test_username_taken_outside_index(self):
+        """Test a name taken outside the openbare path is replaced."""
+        mocker = AWSMock()
+        create_user = mocker.create_user
+
+        def create_user_outside_path(kwarg):
+            if kwarg['UserName'] == 'John':
+                raise client_error('CreateUser', 'EntityAlreadyExists',
+                                   'User with name John already exists.')
+            return create_user(kwarg)
+
+        mocker.create_user = create_user_outside_path
+        with patch('botocore.client.BaseClient._make_api_call',
+                   new=mocker.mock_make_api_call):
+            self.aws_account.checkout()
+
+        self.assertEqual(len(self.aws_account.username), 20)
+        self.assertIn(self.aws_account.username, mocker.users)
+        self.assertTrue(
+            AmazonDemoAccount.amazon_account_utils.iam_user_exists('John')
+        )
+
+    def test_reconcile_iam(self):
+        """Test orphaned IAM users are found and destroyed."""
+        mocker = AWSMock()
+        for name in ['Alice', 'orphan', 'openbare-pool-abc']:
+            mocker.create_user({'UserName': name})
+        PooledIAMUser.objects.create(type='amazondemoaccount',
+                                     username='openbare-pool-abc',
+                                     account='default')
+        for name, state in [('alice', Lendable.READY),
+                            ('ghost', Lendable.READY),
+                            ('pending', Lendable.PROVISIONING)]:
+            AmazonDemoAccount.lendables.create(
+                user=self.user,
+                username=name,
+                state=state,
+                account='default',
+                due_on=datetime.now(timezone.utc)
+            )
+
+        with patch('botocore.client.BaseClient._make_api_call',
+                   new=mocker.mock_make_api_call):
+            out = StringIO()
+            call_command('reconcile_iam', '--dry-run', stdout=out)
+            summary = json.loads(out.getvalue())
+            self.assertEqual(summary['skipped_recent'], ['orphan'])
+            self.assertEqual(summary['orphaned'], [])
+
+            out = StringIO()
+            call_command('reconcile_iam', '--min-age=0', stdout=out)
+            summary = json.loads(out.getvalue())
+
+        self.assertEqual(summary['iam_users'], 2)
+        self.assertEqual(summary['lendables'], 3)
+        self.assertEqual(summary['matched'], 1)
+        self.assertEqual(summary['orphaned'], ['orphan'])
+        self.assertEqual(summary['destroyed'], ['orphan'])
+        self.assertEqual(summary['missing'], ['ghost'])
+        self.assertEqual(sorted(mocker.users), ['Alice', 'openbare-pool-abc'])
+
+    def test_circuit_breaker(self):
+        """Test AWS outages open the circuit and queue teardowns."""
+        self.c.login(username=self.user.username, password='str0ngpa$$w0rd')
+        User.objects.create_user(username='staff',
+                                 password='str0ngpa$$w0rd',
+                                 is_staff=True)
+        mocker = AWSMock()
+        calls = []
+
+        def counting_api_call(client, operation_name, kwarg):
+            calls.append(operation_name)
+            return mocker.mock_make_api_call(operation_name, kwarg)
+
+        checkout_url = reverse('library:checkout', args=['amazondemoaccount'])
+        with self.settings(AWS_BREAKER_FAILURE_THRESHOLD=2,
+                           AWS_BREAKER_RESET_SECONDS=60):
+            with patch('botocore.client.BaseClient._make_api_call',
+                       new=counting_api_call):
+                self.c.post(checkout_url, checkout_data())
+                lendable = self.user.lendable_set.get()
+
+                other = Client()
+                other.login(username='staff', password='str0ngpa$$w0rd')
+                mocker.inject_faults()
+                for i in range(2):
+                    response = other.post(checkout_url, checkout_data(),
+                                          follow=True)
+                    self.assertContains(response, 'Injected fault')
+
+                # Further checkouts fail fast without calling AWS
+                del calls[:]
+                response = other.post(checkout_url, checkout_data(),
+                                      follow=True)
+                self.assertContains(response, 'is not responding right now')
+                self.assertEqual(calls, [])
+
+                # Checkins succeed and queue the teardown
+                response = self.c.get(
+                    reverse('library:checkin', args=[lendable.pk]),
+                    follow=True
+                )
+                self.assertContains(response, 'returned.')
+                self.assertTrue(
+                    Lendable.all_lendables.get(pk=lendable.pk).teardown_pending
+                )
+                self.assertEqual(teardown_pending(), 0)
+                self.assertIn('John', mocker.users)
+
+                status = other.get(reverse('library:aws_status')).json()
+                breaker = status['accounts'][0]['breaker']
+                self.assertEqual(breaker['state'], 'open')
+                self.assertEqual(
+                    [(t['from'], t['to']) for t in breaker['transitions']],
+                    [('closed', 'open')]
+                )
+
+                # A trial call after the cool down closes the circuit
+                mocker.clear_faults()
+                with self.settings(AWS_BREAKER_RESET_SECONDS=0):
+                    self.assertEqual(teardown_pending(), 1)
+
+        self.assertNotIn('John', mocker.users)
+        self.assertFalse(
+            Lendable.all_lendables.get(pk=lendable.pk).teardown_pending
+        )
+        breaker = AmazonDemoAccount.amazon_account_utils.breaker
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_account_sharding(self):
+        """Test checkouts are spread across AWS accounts by occupancy."""
+        pool = AmazonAccountPool([
+            {'name': 'alpha', 'access_key_id': 'AKALPHA',
+             'secret_access_key': 'secret', 'max_users': 1},
+            {'name': 'bravo', 'access_key_id': 'AKBRAVO',
+             'secret_access_key': 'secret', 'account_id_alias': 'bravo',
+             'max_users': 2},
+        ])
+        mockers = {'AKALPHA': AWSMock(), 'AKBRAVO': AWSMock()}
+
+        def routed_api_call(client, operation_name, kwarg):
+            access_key = client._request_signer._credentials.access_key
+            return mockers[access_key].mock_make_api_call(operation_name,
+                                                          kwarg)
+
+        users = [
+            User.objects.create_user(username='user%d' % i) for i in range(4)
+        ]
+        with patch.object(AmazonDemoAccount, 'amazon_accounts', pool), \
+                patch('botocore.client.BaseClient._make_api_call',
+                      new=routed_api_call):
+            lendables = []
+            for user in users[:3]:
+                lendable = AmazonDemoAccount(user=user)
+                lendable.checkout()
+                lendable.save()
+                lendables.append(lendable)
+
+            self.assertEqual([lendable.account for lendable in lendables],
+                             ['alpha', 'bravo', 'bravo'])
+            self.assertEqual(sorted(mockers['AKALPHA'].users), ['user0'])
+            self.assertEqual(sorted(mockers['AKBRAVO'].users),
+                             ['user1', 'user2'])
+            self.assertEqual(
+                lendables[1].credentials['Web Console URL'],
+                'https://bravo.signin.aws.amazon.com/console'
+            )
+
+            # All accounts are full
+            with self.assertRaisesRegex(Exception, 'unavailable'):
+                AmazonDemoAccount(user=users[3]).checkout()
+
+            # Checkin tears down in the lendable's own account
+            AmazonDemoAccount.lendables.get(user=users[1]).checkin()
+            self.assertEqual(sorted(mockers['AKBRAVO'].users), ['user2'])
+
+            lendable = AmazonDemoAccount(user=users[3])
+            lendable.checkout()
+            lendable.save()
+            self.assertEqual(lendable.account, 'bravo')
+
+            pool.invalidate()
+            self.assertEqual(
+                pool.occupancy(AmazonDemoAccount.account_occupancy),
+                {'alpha': 1, 'bravo': 2}
+            )
+
+            # IAM users waiting for their teardown still take a place
+            Lendable.all_lendables.filter(user=users[1]).update(
+                teardown_pending=True
+            )
+            pool.invalidate()
+            self.assertEqual(
+                pool.occupancy(AmazonDemoAccount.account_occupancy),
+                {'alpha': 1, 'bravo': 3}
+            )
+            Lendable.all_lendables.update(teardown_pending=False)
+
+            # Lendables of an account no longer configured live in the
+            # default one
+            Lendable.all_types.filter(user=users[0]).update(account='retired')
+            pool.invalidate()
+            self.assertEqual(
+                pool.occupancy(AmazonDemoAccount.account_occupancy),
+                {'alpha': 1, 'bravo': 2}
+            )
+            self.assertEqual(
+                AmazonDemoAccount.lendables.filter(
+                    AmazonDemoAccount.in_account(pool.default)
+                ).get().user,
+                users[0]
+            )
+            AmazonDemoAccount.lendables.get(user=users[0]).checkin()
+            self.assertEqual(mockers['AKALPHA'].users, {})
+
+    def test_connections_cached(self):
+        """Test sessions, clients and resources are reused."""
+        utils = AmazonAccountUtils('43543253245', '6543654rfdfds')
+        other = AmazonAccountUtils('43543253245', '6543654rfdfds')
+
+        self.assertIs(utils._get_aws_session(), other._get_aws_session())
+        self.assertIs(utils._get_iam_client(), other._get_iam_client())
+        self.assertIs(utils._get_iam_resource(), other._get_iam_resource())
+
+        # Resources are not thread safe, other threads get their own
+        resources = []
+        thread = threading.Thread(
+            target=lambda: resources.append(utils._get_iam_resource())
+        )
+        thread.start()
+        thread.join()
+        self.assertIsNot(resources[0], utils._get_iam_resource())
+
+        # Resources of a thread are kept in its own storage, not shared
+        self.assertNotIn(
+            id(resources[0]),
+            [id(resource) for generation, resource in
+             connection_cache._local.resources.values()]
+        )
+
+        # Rotating credentials drops the cached connections
+        client = utils._get_iam_client()
+        resource = utils._get_iam_resource()
+        utils.invalidate_connections()
+        self.assertIsNot(client, utils._get_iam_client())
+        self.assertIsNot(resource, utils._get_iam_resource())
+        connection_cache.invalidate()
+
+
+class ConcurrencyTestCase(TransactionTestCase):
+    """Test concurrent changes to a lendable from several threads."""
+
+    threads = 8
+
+    def setUp(self):
+        """Check out a lendable."""
+        Lendable.forecast.invalidate()
+        index_cache.cache.clear()
+        self.user = User.objects.create_user(username='user1')
+        self.lendable = Lendable(user=self.user)
+        self.lendable.checkout()
+
+    def race(self, target):
+        """Call target from every thread at once, return the results."""
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def run():
+            try:
+                lendable = Lendable.all_types.get(pk=self.lendable.pk)
+                barrier.wait()
+                while True:
+                    try:
+                        results.append(target(lendable))
+                    except OperationalError:
+                        # The in memory SQLite test database fails instead
+                        # of waiting for the lock like other databases.
+                        time.sleep(0.001)
+                    else:
+                        break
+            except ValidationError:
+                results.append(None)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_renew(self):
+        """Test concurrent renewals stop at max_renewals."""
+        due_on = self.lendable.due_on
+        renewals = self.lendable.renewals
+        results = self.race(lambda lendable: lendable.renew())
+        self.assertEqual(len(results), self.threads)
+
+        # No renewal is lost and none goes past max_renewals
+
+        lendable = Lendable.all_types.get(pk=self.lendable.pk)
+        self.assertEqual(lendable.renewals, 0)
+        self.assertEqual(
+            lendable.due_on - due_on,
+            timedelta(lendable.lending_period_in_days * renewals)
+        )
+
+    def test_index_cache_invalidated_on_commit(self):
+        """Test versions are bumped again when the transaction commits."""
+        version = index_cache.versions(['lendable'])['lendable']
+        with transaction.atomic():
+            index_cache.invalidate('lendable')
+            self.assertEqual(index_cache.versions(['lendable'])['lendable'],
+                             version + 1)
+        self.assertEqual(index_cache.versions(['lendable'])['lendable'],
+                         version + 2)
+
+        index_cache.invalidate('lendable')
+        self.assertEqual(index_cache.versions(['lendable'])['lendable'],
+                         version + 3)
+
+    def test_provisioned_outside_transaction(self):
+        """Test no transaction is held while lendables are provisioned."""
+        in_transaction = []
+
+        def provision(lendable):
+            in_transaction.append(connection.in_atomic_block)
+            lendable.state = Lendable.READY
+
+        with patch.object(Lendable, 'provision', autospec=True,
+                          side_effect=provision):
+            Lendable(user=User.objects.create_user('user2')).checkout()
+            Lendable(user=User.objects.create_user('user3')).checkout(
+                defer_provisioning=True
+            )
+            self.assertEqual(provision_pending(), 1)
+        self.assertEqual(in_transaction, [False, False])
+        self.assertEqual(
+            Lendable.all_types.filter(state=Lendable.READY).count(), 3
+        )
+
+    def test_concurrent_checkin(self):
+        """Test only one of concurrent checkins tears down."""
+        with patch.object(Lendable, 'teardown') as teardown:
+            results = self.race(lambda lendable: lendable.checkin())
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(results.count(False), self.threads - 1)
+        self.assertEqual(teardown.call_count, 1)
+        self.assertEqual(LendableInventory.count_active('lendable'), 0)
+
+
+class RateLimiterTestCase(TestCase):
+    """Test the shared AWS rate limiter."""
+
+    def setUp(self):
+        """Use a private state directory."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'bucket.json')
+
+    def tearDown(self):
+        """Remove the state directory."""
+        self.directory.cleanup()
+
+    def test_priorities(self):
+        """Test background callers leave a reserve for interactive ones."""
+        bucket = rate_limiter.FileTokenBucket(self.path, rate=1, burst=4)
+        # The same state file is shared by every bucket using it.
+        other = rate_limiter.FileTokenBucket(self.path, rate=1, burst=4)
+
+        with patch('library.rate_limiter.time.sleep',
+                   side_effect=RuntimeError('waited')):
+            with rate_limiter.priority(rate_limiter.BACKGROUND):
+                bucket.acquire()
+                other.acquire()
+                with self.assertRaises(RuntimeError):
+                    bucket.acquire()
+
+            other.acquire()
+            bucket.acquire()
+            with self.assertRaises(RuntimeError):
+                bucket.acquire()
+
+    def test_adaptive_rate(self):
+        """Test throttles narrow the rate and successes widen it."""
+        bucket = rate_limiter.FileTokenBucket(self.path, rate=10)
+        bucket.throttled()
+        bucket.throttled()
+        self.assertEqual(bucket.rate(), 2.5)
+        for i in range(10):
+            bucket.succeeded()
+        self.assertAlmostEqual(bucket.rate(), 3.5)
+        for i in range(100):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate(), 10)
+
+    def test_iam_client_limited(self):
+        """Test IAM clients report their calls to the bucket."""
+        with self.settings(AWS_RATE_LIMIT_DIR=self.directory.name,
+                           AWS_IAM_RATE_LIMIT=10):
+            client = connection_cache.client('iam', 'ratelimited', 'secret')
+            bucket = rate_limiter.get_iam_bucket('ratelimited')
+
+        class Body:
+            def __init__(self, content):
+                self.content = content
+
+            def stream(self):
+                return [self.content]
+
+        throttled = (
+            b'<ErrorResponse><Error><Type>Sender</Type>'
+            b'<Code>Throttling</Code><Message>Rate exceeded</Message>'
+            b'</Error><RequestId>1</RequestId></ErrorResponse>'
+        )
+        user = (
+            b'<GetUserResponse><GetUserResult><User><Path>/</Path>'
+            b'<UserName>john</UserName><UserId>AIDA0000000000000001</UserId>'
+            b'<Arn>arn:aws:iam::123456789012:user/john</Arn>'
+            b'<CreateDate>2020-01-01T00:00:00Z</CreateDate></User>'
+            b'</GetUserResult></GetUserResponse>'
+        )
+        responses = [(400, throttled), (400, throttled), (200, user)]
+
+        def send(request, **kwargs):
+            status, content = responses.pop(0)
+            return AWSResponse(request.url, status, {}, Body(content))
+
+        # botocore retries the throttled attempts itself, each of them
+        # takes a token and narrows the rate
+        client.meta.events.register_last('before-send.iam', send)
+        with patch.object(rate_limiter.FileTokenBucket,
+                          'acquire') as acquire, \
+                patch('botocore.endpoint.time.sleep'):
+            client.get_user(UserName='john')
+
+        self.assertEqual(acquire.call_count, 3)
+        self.assertAlmostEqual(bucket.rate(), 2.6)
+        connection_cache.invalidate('ratelimited')
+
+    def test_private_directory(self):
+        """Test the state of the limiter is private by default."""
+        with patch('library.rate_limiter.tempfile.gettempdir',
+                   return_value=self.directory.name):
+            with self.settings(AWS_RATE_LIMIT_DIR=None):
+                bucket = rate_limiter.get_iam_bucket('private')
+            bucket.acquire()
+            self.assertEqual(os.stat(bucket.path).st_mode & 0o777, 0o600)
+            directory = os.path.dirname(bucket.path)
+            self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+            # A directory others can write to is not used
+            os.chmod(directory, 0o777)
+            with self.settings(AWS_RATE_LIMIT_DIR=None):
+                self.assertIsNone(rate_limiter.get_iam_bucket('private'))
+
+    def test_shared_directory(self):
+        """Test the configured state directory is shared or fails loudly."""
+        directory = os.path.join(self.directory.name, 'ratelimit')
+        with self.settings(AWS_RATE_LIMIT_DIR=directory):
+            bucket = rate_limiter.get_iam_bucket('shared')
+            bucket.acquire()
+            self.assertEqual(os.stat(bucket.path).st_mode & 0o777, 0o660)
+            self.assertEqual(checks.rate_limit_dir(None), [])
+
+        # A directory that can't be created is reported, not skipped
+        with self.settings(AWS_RATE_LIMIT_DIR=os.path.join(bucket.path,
+                                                           'ratelimit')):
+            with self.assertRaises(ImproperlyConfigured):
+                rate_limiter.get_iam_bucket('shared')
+            errors = checks.rate_limit_dir(None)
+        self.assertEqual([error.id for error in errors], ['openbare.E001'])
+
 
 class FrontpageMessageTestCase(TestCase):
     """Test frontpage messages in library app."""
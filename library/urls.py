@@ -28,6 +28,26 @@ urlpatterns = [
         views.CheckoutView.as_view(),
         name='checkout'
         ),
+    url(r'^resource/(?P<item_subtype>\w+)/waitlist/join$',
+        views.join_waitlist,
+        name='join_waitlist'
+        ),
+    url(r'^resource/(?P<item_subtype>\w+)/waitlist/leave$',
+        views.leave_waitlist,
+        name='leave_waitlist'
+        ),
+    url(r'^resource/(?P<item_subtype>\w+)/checked_out$',
+        views.checked_out,
+        name='checked_out'
+        ),
+    url(r'^instance/(?P<primary_key>\d+)/status$',
+        views.status,
+        name='status'
+        ),
+    url(r'^instance/(?P<primary_key>\d+)/credentials$',
+        views.CredentialsView.as_view(),
+        name='credentials'
+        ),
     url(r'^instance/(?P<primary_key>\d+)/renew$',
         views.renew,
         name='renew'
@@ -40,5 +60,10 @@ urlpatterns = [
         views.request_extension,
         name='request_extension'
         ),
+    url(r'^status/aws$', views.aws_status, name='aws_status'),
+    url(r'^status/index_cache$',
+        views.index_cache_status,
+        name='index_cache_status'
+        ),
     url(r'^login/required/$', views.require_login, name='require_login')
 ]
@@ -19,22 +19,41 @@
 
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
 from django.core.urlresolvers import reverse
+from django.db.models import BooleanField, Case, Q, Value, When
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.template.defaultfilters import slugify
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.crypto import get_random_string
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+from django.views.decorators.http import require_POST
 from django.views.generic.base import TemplateView
 
 import base64
+import hashlib
 import json
 import logging
+import time
 
+from .availability import AvailabilitySnapshot
+from .index_cache import index_cache
 from .templatetags import formatting_filters
+from .models import AmazonDemoAccount
 from .models import Lendable
 from .models import FrontpageMessage
+from .models import LendableInventory
+from .models import WaitlistEntry
+
+# Number of lendables per page of the resource details
+CHECKED_OUT_PAGE_SIZE = 50
 
 
 class IndexView(TemplateView):
@@ -45,16 +64,104 @@ class IndexView(TemplateView):
     """
 
     template_name = 'library/home.html'
+    # Whether the page may be answered from caches, see get
+    cache_page = True
+
+    def get(self, request, *args, **kwargs):
+        """Display the page, revalidated with an ETag.
+
+        The page anonymous users see only changes with the frontpage
+        messages. It is cached as a whole until one of them changes and
+        sent with an ETag, so repeated requests get a 304. No Last-Modified
+        is sent, deleting the newest message would move it back in time.
+        The page of a user is sent with an ETag of what it shows, see
+        user_etag, and repeated requests get a 304 before it is built.
+        Pages with messages queued for the user are not cached.
+        """
+        if not self.cache_page or len(messages.get_messages(request)):
+            return super(IndexView, self).get(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            return self.get_user_page(request, *args, **kwargs)
+
+        page = index_cache.get(
+            'page:%s' % request.path,
+            ['frontpage'],
+            lambda: self.render_anonymous_page(**kwargs)
+        )
+        response = HttpResponse(page['content'],
+                                content_type=page['content_type'])
+        response['ETag'] = page['etag']
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return get_conditional_response(
+            request,
+            etag=page['etag'],
+            response=response
+        )
+
+    def get_user_page(self, request, *args, **kwargs):
+        """Display the page of a user, unless their copy is current.
+
+        The ETag is built from the versions of the home page cache, so it is
+        only sent when they are shared by every process.
+        """
+        if not index_cache.ttl or not index_cache.shared:
+            return super(IndexView, self).get(request, *args, **kwargs)
+
+        etag = self.user_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super(IndexView, self).get(request, *args, **kwargs)
+            response.render()
+            # Rendering sets the CSRF cookie of a first visit
+            etag = self.user_etag()
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    def user_etag(self):
+        """Return the ETag of the page of the user, without a query.
+
+        The page changes with the lendables of every type, whose versions
+        are kept by the home page cache, and with the user. It also shows
+        the CSRF token, and availability changes as time passes, so the
+        ETag changes with the CSRF cookie and every INDEX_CACHE_TTL seconds.
+        """
+        user = self.request.user
+        scopes = list(Lendable.lendable_types) + ['lendable']
+        versions = index_cache.versions(scopes)
+        stamp = [
+            user.pk,
+            user.username,
+            user.get_full_name(),
+            user.is_staff,
+            user.is_superuser,
+            self.request.META.get('CSRF_COOKIE'),
+            int(time.time() // index_cache.ttl),
+        ] + [versions[scope] for scope in scopes]
+        return '"%s"' % hashlib.md5(
+            repr(stamp).encode('utf-8')
+        ).hexdigest()
+
+    def render_anonymous_page(self, **kwargs):
+        """Return the page for anonymous users as a dictionary."""
+        context = self.get_context_data(**kwargs)
+        response = self.render_to_response(context).render()
+        return {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': '"%s"' % hashlib.md5(response.content).hexdigest(),
+        }
 
     def get_context_data(self, **kwargs):
         """Return context dictionary for view."""
         context = super(IndexView, self).get_context_data(**kwargs)
 
-        context['resources'] = get_lendable_resources(self.request.user)
-        context['user_items'] = get_items_checked_out_by(self.request.user)
+        context.update(get_index_context(self.request.user))
         context['checkout'] = False
         context['host'] = settings.HOST
-        context['frontpage_messages'] = FrontpageMessage.objects.all()
+        context['waitlist'] = getattr(settings, 'ASYNC_CHECKOUT', False)
 
         return context
 
@@ -76,12 +183,18 @@ class CheckoutView(LoginRequiredMixin, IndexView):
     Checkout a lendable of the given item_subtype for the user. The
     user is provided the necessary credentials for the lendable.
 
+    Checkouts are POSTed with a one-time checkout_token. Repeating the
+    request, by a double click or a retry, finds the lendable created by
+    the first one instead of checking out again.
+
     **Template:**
     :template:`library/home.html`
     """
 
     redirect_field_name = None
     login_url = 'library:require_login'
+    # Credentials are shown once
+    cache_page = False
 
     def __init__(self):
         """Initialize the view."""
@@ -89,28 +202,90 @@ class CheckoutView(LoginRequiredMixin, IndexView):
         self.item = None
 
     def get(self, request, *args, **kwargs):
-        """Process checkout when view triggered by GET request."""
+        """Ignore GET requests, such as link prefetches."""
+        return redirect(reverse('library:index'))
+
+    def post(self, request, *args, **kwargs):
+        """Process checkout when view triggered by POST request."""
         logger = logging.getLogger('django')
 
+        token = request.POST.get('checkout_token', '')
+        if not token or len(token) > 64:
+            messages.error(request, 'Invalid checkout request.')
+            return redirect(reverse('library:index'))
+
+        self.item = self.checked_out_with(token)
+        if self.item:
+            return self.checkout_result()
+
+        defer_provisioning = getattr(settings, 'ASYNC_CHECKOUT', False)
         try:
             self.item = Lendable(type=self.kwargs.get('item_subtype', None),
-                                 user=self.request.user)
+                                 user=self.request.user,
+                                 checkout_token=token)
 
-            self.item.checkout()
-            self.item.save()
+            self.item.checkout(defer_provisioning=defer_provisioning)
         except Exception as e:
+            # A concurrent submission of the same request got there first
+            first = self.checked_out_with(token)
+            if first and first.pk != self.item.pk:
+                self.item = first
+                return self.checkout_result()
             messages.error(request, e)
             logger.exception('%s: %s' % (type(e).__name__, e))
             return redirect(reverse('library:index'))
-        else:
+
+        return self.checkout_result(provisioned=True)
+
+    def checked_out_with(self, token):
+        """Return the lendable checked out by the user with token."""
+        return Lendable.all_lendables.filter(
+            user=self.request.user,
+            checkout_token=token
+        ).first()
+
+    def checkout_result(self, provisioned=False):
+        """Present the outcome of the checkout of self.item.
+
+        Credentials of a checkout provisioned by this request, see
+        provisioned, are shown at once and never stored. Those of a
+        deferred checkout are collected from the home page once it is
+        ready.
+        """
+        if self.item.state == Lendable.FAILED:
+            messages.error(
+                self.request,
+                "'%s' could not be prepared, please try again." %
+                self.item.name
+            )
+        elif self.item.state in (Lendable.QUEUED, Lendable.PROVISIONING):
+            messages.info(
+                self.request,
+                "'%s' is being prepared for you. Your credentials will be "
+                "shown as soon as it is ready." % self.item.name
+            )
+        elif provisioned:
             messages.success(
-                request,
+                self.request,
                 "'%s' is checked out to you until %s." %
                 (self.item.name,
                  formatting_filters.format_date(self.item.due_on))
             )
-
-        return super(CheckoutView, self).get(request, *args, **kwargs)
+            return super(CheckoutView, self).get(self.request, *self.args,
+                                                 **self.kwargs)
+        elif self.item.pending_credentials:
+            messages.info(
+                self.request,
+                "'%s' is ready, collect your credentials below." %
+                self.item.name
+            )
+        else:
+            messages.warning(
+                self.request,
+                "'%s' is already checked out to you, its credentials were "
+                "shown when it was." % self.item.name
+            )
+        return redirect(reverse('library:index'))
 
     def get_context_data(self, **kwargs):
         """Return context dictionary for view."""
@@ -127,6 +302,143 @@ class CheckoutView(LoginRequiredMixin, IndexView):
         return context
 
 
+class CredentialsView(CheckoutView):
+    """Present the credentials of a checkout.
+
+    Credentials are shown once, after the :model:`library.Lendable` has
+    been provisioned by the lendable worker. They are collected by a POST
+    from the home page, GET requests, such as link prefetches or unfurls,
+    are redirected there and leave them alone.
+
+    **Template:**
+    :template:`library/home.html`
+    """
+
+    def post(self, request, *args, **kwargs):
+        """Display the pending credentials of the lendable."""
+        self.item = get_object_or_404(Lendable.all_types,
+                                      pk=self.kwargs['primary_key'],
+                                      user=request.user,
+                                      state=Lendable.READY)
+        self.item.credentials = self.item.pop_pending_credentials()
+        if self.item.credentials is None:
+            messages.warning(
+                request,
+                "The credentials for '%s' have already been collected." %
+                self.item.name
+            )
+            return redirect(reverse('library:index'))
+
+        messages.success(
+            request,
+            "'%s' is checked out to you until %s." %
+            (self.item.name, formatting_filters.format_date(self.item.due_on))
+        )
+        return super(CheckoutView, self).get(request, *args, **kwargs)
+
+
+@login_required(redirect_field_name=None, login_url='library:require_login')
+def status(request, primary_key):
+    """Report the provisioning state of a :model:`library.Lendable`.
+
+    Polled by the home page while an asynchronous checkout is provisioned.
+
+    Returns:
+        JSON with the state and, once ready, the URL of the credentials.
+    """
+    item = get_object_or_404(Lendable.all_lendables,
+                             pk=primary_key,
+                             user=request.user)
+    data = {'state': item.state}
+    if item.state == Lendable.READY and item.pending_credentials:
+        data['credentials_url'] = reverse('library:credentials',
+                                          args=[item.pk])
+    elif item.state == Lendable.FAILED:
+        data['message'] = "'%s' could not be prepared, please try again." % (
+            item.name
+        )
+    return JsonResponse(data)
+
+
+@login_required(redirect_field_name=None, login_url='library:require_login')
+def checked_out(request, item_subtype):
+    """List active :model:`library.Lendable` of a type, a page at a time.
+
+    Loaded by the resource details on the home page. Pages are ordered by
+    due date and follow on from the due date and primary key of the last
+    lendable of the previous page, passed as after.
+
+    Returns:
+        JSON with the lendables and, unless it is the last page, the URL
+        of the next one.
+    """
+    lendables = Lendable.all_types.filter(type=item_subtype)
+    after = request.GET.get('after')
+    if after:
+        due_on, _sep, primary_key = after.rpartition(',')
+        due_on = parse_datetime(due_on)
+        if not due_on or not primary_key.isdigit():
+            return JsonResponse({'error': 'Invalid after.'}, status=400)
+        lendables = lendables.filter(
+            Q(due_on__gt=due_on) |
+            Q(due_on=due_on, pk__gt=int(primary_key))
+        )
+
+    rows = list(lendables.order_by('due_on', 'pk').values_list(
+        'pk',
+        'user__username',
+        'due_on',
+        'renewals'
+    )[:CHECKED_OUT_PAGE_SIZE + 1])
+
+    data = {
+        'items': [{
+            'user': username,
+            'due_on': formatting_filters.format_date(due_on),
+            'renewable': renewals > 0,
+        } for pk, username, due_on, renewals in rows[:CHECKED_OUT_PAGE_SIZE]],
+        'next': None,
+    }
+    if len(rows) > CHECKED_OUT_PAGE_SIZE:
+        pk, username, due_on, renewals = rows[CHECKED_OUT_PAGE_SIZE - 1]
+        data['next'] = '%s?%s' % (
+            reverse('library:checked_out', args=[item_subtype]),
+            urlencode({'after': '%s,%d' % (due_on.isoformat(), pk)})
+        )
+    return JsonResponse(data)
+
+
+@staff_member_required
+def index_cache_status(request):
+    """Report the hits and misses of the home page cache of this process.
+
+    Returns:
+        JSON with the hit and miss counters.
+    """
+    return JsonResponse(index_cache.stats())
+
+
+@staff_member_required
+def aws_status(request):
+    """Report the occupancy and circuit breaker state of the AWS accounts.
+
+    Returns:
+        JSON with the IAM users in use and the breaker state, failure count
+        and recent transitions of every account.
+    """
+    pool = AmazonDemoAccount.amazon_accounts
+    occupancy = pool.occupancy(AmazonDemoAccount.account_occupancy)
+    return JsonResponse({'accounts': [
+        {
+            'name': name,
+            'occupancy': occupancy[name],
+            'max_users': pool.max_users[name],
+            'breaker': utils.breaker.snapshot(),
+        }
+        for name, utils in pool.accounts.items()
+    ]})
+
+
 @login_required(redirect_field_name=None, login_url='library:require_login')
 def renew(request, primary_key):
     """Renew :model:`library.Lendable` for the length of lending_period_in_days.
@@ -157,6 +469,60 @@ def renew(request, primary_key):
     return redirect(reverse('library:index'))
 
 
+@login_required(redirect_field_name=None, login_url='library:require_login')
+@require_POST
+def join_waitlist(request, item_subtype):
+    """Add the user to the waitlist of a lendable type.
+
+    The oldest waiter gets the next lendable of the type returned checked
+    out and is told by email once the lendable worker provisioned it, so
+    waitlists are only offered with ASYNC_CHECKOUT.
+
+    Redirect:
+    :view:`library.index`
+    """
+    lendable = Lendable.lendable_types.get(item_subtype)
+    if not lendable:
+        raise Http404('No lendable type %s' % item_subtype)
+    if not getattr(settings, 'ASYNC_CHECKOUT', False):
+        messages.error(request, 'Waitlists are not available.')
+        return redirect(reverse('library:index'))
+
+    position = WaitlistEntry.join(item_subtype, request.user)
+    if LendableInventory.count_active(item_subtype) < \
+            lendable.max_checked_out:
+        # A lendable was returned while joining
+        WaitlistEntry.fulfil(item_subtype)
+    if WaitlistEntry.objects.filter(type=item_subtype,
+                                    user=request.user).exists():
+        messages.success(
+            request,
+            "You are number %d on the waitlist for '%s'. It will be checked "
+            "out to you as soon as one is returned." %
+            (position, lendable.name)
+        )
+    else:
+        messages.info(
+            request,
+            "'%s' is being prepared for you. Your credentials will be shown "
+            "as soon as it is ready." % lendable.name
+        )
+    return redirect(reverse('library:index'))
+
+
+@login_required(redirect_field_name=None, login_url='library:require_login')
+@require_POST
+def leave_waitlist(request, item_subtype):
+    """Remove the user from the waitlist of a lendable type.
+
+    Redirect:
+    :view:`library.index`
+    """
+    WaitlistEntry.objects.filter(type=item_subtype, user=request.user).delete()
+    messages.success(request, 'You left the waitlist.')
+    return redirect(reverse('library:index'))
+
+
 @login_required(redirect_field_name=None, login_url='library:require_login')
 def request_extension(request, primary_key):
     """Send email to admins to request :model:`library.Lendable` extension.
@@ -208,43 +574,123 @@ def checkin(request, primary_key):
                              pk=primary_key,
                              user=request.user)
     try:
-        item.checkin()
+        checked_in = item.checkin()
     except Exception as e:
         messages.error(request, e)
     else:
-        messages.success(request, "'%s' returned." % (item.name))
+        if checked_in:
+            messages.success(request, "'%s' returned." % (item.name))
+        else:
+            messages.error(request,
+                           "'%s' was already returned." % (item.name))
     return redirect(reverse('library:index'))
 
 
+def get_index_context(user):
+    """Return the resources, the user's items and the frontpage messages.
+
+    They are cached per user and lendable type until a lendable of the
+    type or its waitlist changes, and the messages, shown to anonymous
+    users only, until one of them is changed. Each resource gets a new
+    checkout token.
+    """
+    names = {}
+    resource_names = []
+    items_name = None
+    if not user or user.is_anonymous:
+        names['frontpage_messages'] = ['frontpage']
+    else:
+        for item_subtype in Lendable.lendable_types:
+            name = 'resource:%s:%d' % (item_subtype, user.pk)
+            names[name] = [item_subtype]
+            resource_names.append(name)
+        # Lendables of every type, including the base one
+        items_name = 'user_items:%d' % user.pk
+        names[items_name] = list(Lendable.lendable_types) + ['lendable']
+
+    def load(missing):
+        values = {}
+        for name in missing:
+            if name == 'frontpage_messages':
+                values[name] = list(FrontpageMessage.objects.all())
+            elif name == items_name:
+                values[name] = list(get_items_checked_out_by(user))
+            elif name not in values:
+                # One snapshot covers every type
+                for resource in get_lendable_resources(user):
+                    values['resource:%s:%d' % (
+                        resource['item_subtype'],
+                        user.pk
+                    )] = resource
+        return values
+
+    values = index_cache.get_many(names, load)
+    resources = []
+    for name in resource_names:
+        resource = dict(values[name])
+        resource['checkout_token'] = get_random_string(32)
+        resources.append(resource)
+    return {
+        'resources': resources,
+        'user_items': values.get(items_name, []),
+        'frontpage_messages': values.get('frontpage_messages',
+                                         FrontpageMessage.objects.all()),
+    }
+
+
 def get_lendable_resources(user):
     """Collect the classes of items that can be checked out.
 
     Their class and plugin data will be presented as
-    a list of resources to 'check out'.
+    a list of resources to 'check out'. The number of queries does not
+    depend on the number of lendable types.
     """
     if not user or user.is_anonymous:
         return []
 
+    availability = AvailabilitySnapshot(user)
+    waitlist_positions = WaitlistEntry.positions(user)
+
     resources = []
-    for lendable in Lendable.__subclasses__():
+    for item_subtype, lendable in Lendable.lendable_types.items():
         resources.append({
             'name': lendable.name,
             'description': lendable.description,
-            'item_subtype': lendable.__name__.lower(),
+            'description_html': lendable.description_html,
+            'item_subtype': item_subtype,
             'max_checked_out': lendable.max_checked_out,
-            'is_available_for_user': lendable.is_available_for_user(user),
-            'next_available_date': lendable.next_available_date(),
-            'checked_out_items': lendable.all_types.all(),
+            'checked_out_count':
+                availability.for_type(lendable).active,
+            'is_available_for_user':
+                availability.is_available_for_user(lendable),
+            'is_checked_out_to_user':
+                availability.for_type(lendable).held > 0,
+            'waitlist_position': waitlist_positions.get(item_subtype),
+            'next_available_date':
+                availability.next_available_date(lendable),
+            'expected_returns': lendable.expected_returns(),
+            'checkout_token': get_random_string(32),
         })
     return resources
 
 
 def get_items_checked_out_by(user=None):
-    """Return the user's checked out lendables."""
+    """Return the user's checked out lendables.
+
+    Whether credentials are waiting to be collected is annotated as
+    credentials_pending, the credentials themselves are not loaded, so
+    they never end up in the index cache.
+    """
     if not user or user.is_anonymous:
         return []
 
-    return Lendable.all_types.filter(user=user).order_by('checked_out_on')
+    return Lendable.all_types.filter(user=user).annotate(
+        credentials_pending=Case(
+            When(pending_credentials__isnull=False, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
+        )
+    ).defer('pending_credentials').order_by('checked_out_on')
 
 
 def _admin_emails():
@@ -0,0 +1,177 @@
+"""Background processing of deferred lendable work."""
+
+# Copyright © 2026 SUSE LLC.
+#
+# This file is part of openbare.
+#
+# openbare is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbare is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbare. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import time
+
+from django.db import transaction
+from django.utils.crypto import get_random_string
+
+from library import rate_limiter
+from library.circuit_breaker import CircuitOpenError
+from library.models import (AmazonDemoAccount, Lendable, PooledIAMUser,
+                            WarmPoolMetrics)
+
+logger = logging.getLogger('django')
+
+
+def provision_lendable(primary_key):
+    """Provision a lendable left in the queued state.
+
+    Moving it to the provisioning state claims it, so concurrent workers
+    skip it, and no transaction is held while provisioning. A lendable that
+    fails to provision is aborted, which marks it failed and releases its
+    slot. The user of a lendable checked out from the waitlist is told by
+    email once it is ready.
+
+    Returns:
+        True if the lendable was provisioned.
+    """
+    claimed = Lendable.all_types.filter(
+        pk=primary_key,
+        state=Lendable.QUEUED
+    ).update(state=Lendable.PROVISIONING)
+    if not claimed:
+        return False
+    lendable = Lendable.all_types.get(pk=primary_key)
+
+    try:
+        lendable.provision()
+    except CircuitOpenError:
+        # Back to the queue until the service recovers.
+        Lendable.all_types.filter(
+            pk=primary_key,
+            state=Lendable.PROVISIONING
+        ).update(state=Lendable.QUEUED)
+        return False
+    except Exception as e:
+        logger.exception(
+            "Provisioning lendable %s failed: %s" % (primary_key, e)
+        )
+        lendable.abort_checkout()
+        return False
+
+    try:
+        lendable.finish_provisioning()
+    except Exception as e:
+        logger.warning("Lendable %s not provisioned: %s" % (primary_key, e))
+        return False
+    if lendable.from_waitlist:
+        lendable.notify_waiter()
+    return True
+
+
+def provision_pending(limit=None):
+    """Provision queued lendables, oldest first.
+
+    Returns:
+        The number of lendables provisioned.
+    """
+    pending = Lendable.all_types.filter(
+        state=Lendable.QUEUED
+    ).order_by('checked_out_on').values_list('pk', flat=True)
+    if limit:
+        pending = pending[:limit]
+
+    return sum(1 for pk in list(pending) if provision_lendable(pk))
+
+
+def teardown_pending(limit=None):
+    """Tear down resources of checked in lendables queued for teardown.
+
+    The backing service is called with background priority, yielding to
+    checkouts. Stops early while it is unavailable.
+
+    Returns:
+        The number of lendables torn down.
+    """
+    pending = Lendable.all_lendables.filter(
+        teardown_pending=True
+    ).order_by('checked_in_on').values_list('pk', flat=True)
+    if limit:
+        pending = pending[:limit]
+
+    count = 0
+    for pk in list(pending):
+        with transaction.atomic():
+            lendable = Lendable.all_lendables.select_for_update(
+                skip_locked=True
+            ).filter(pk=pk, teardown_pending=True).first()
+            if not lendable:
+                continue
+            try:
+                with rate_limiter.priority(rate_limiter.BACKGROUND):
+                    lendable.teardown()
+            except CircuitOpenError:
+                break
+            except Exception as e:
+                logger.exception(
+                    "Tearing down lendable %s failed: %s" % (pk, e)
+                )
+                continue
+            lendable.teardown_pending = False
+            lendable.save(update_fields=['teardown_pending'])
+            count += 1
+    return count
+
+
+def refill_warm_pool(lendable_class=AmazonDemoAccount):
+    """Create pooled IAM users until the warm pool of every account is full.
+
+    Returns:
+        The number of users added to the pools.
+    """
+    lendable_type = lendable_class.__name__.lower()
+    added = 0
+    for utils in lendable_class.amazon_accounts.accounts.values():
+        missing = (
+            PooledIAMUser.pool_size(lendable_type) -
+            PooledIAMUser.objects.filter(
+                type=lendable_type,
+                account=utils.name
+            ).count()
+        )
+        for i in range(missing):
+            username = 'openbare-pool-%s' % get_random_string(length=12)
+            started = time.time()
+            try:
+                with rate_limiter.priority(rate_limiter.BACKGROUND):
+                    utils.create_pool_account(
+                        username,
+                        lendable_class.iam_groups()
+                    )
+            except Exception as e:
+                logger.exception(
+                    "Refilling warm pool of account %s failed: %s" % (
+                        utils.name, e
+                    )
+                )
+                break
+            PooledIAMUser.objects.create(
+                type=lendable_type,
+                username=username,
+                account=utils.name
+            )
+            WarmPoolMetrics.record(
+                lendable_type,
+                refills=1,
+                refill_seconds=time.time() - started
+            )
+            added += 1
+    return added
@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
 
+from library.availability import AvailabilitySnapshot
 from library.models import Lendable
 
 recipient_choices = (('', 'Send To ...'),
@@ -27,6 +28,8 @@ recipient_choices = (('', 'Send To ...'),
 def lendable_choices():
     """Generate a tuple of lendable choices.
 
+    Each lendable is labelled with the number of users holding one.
+
     Returns:
         A tuple containing value/label pairs representing the
         lendable choices for a select widget.
@@ -34,7 +37,12 @@ def lendable_choices():
     choices = (('', 'Choose lendable ...'),
                ('all', 'All lendables'))
 
-    choices += tuple((lendable.__name__.lower(), lendable.name)
-                     for lendable in Lendable.__subclasses__())
+    availability = AvailabilitySnapshot()
+    choices += tuple(
+        (item_subtype, '%s (%d checked out)' % (
+            lendable.name, availability.for_type(lendable).active
+        ))
+        for item_subtype, lendable in Lendable.lendable_types.items()
+    )
 
     return choices
@@ -29,7 +29,7 @@ class SendMailForm(forms.Form):
 
     subject = forms.CharField(max_length=120)
     to = forms.ChoiceField(choices=recipient_choices)
-    lendable = forms.ChoiceField(choices=lendable_choices(), required=False)
+    lendable = forms.ChoiceField(choices=lendable_choices, required=False)
     message = forms.CharField(widget=forms.Textarea(attrs={'rows': 10}))
 
     def clean_message(self):
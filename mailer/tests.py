@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
 
+from datetime import timedelta
 from unittest.mock import patch
 
 from django.conf import settings
@@ -24,9 +25,12 @@ from django.contrib.auth.models import AnonymousUser, User
 from django.core import mail
 from django.test import Client, RequestFactory, TestCase
 from django.urls import reverse
+from django.utils import timezone
 
+from library.models import AmazonDemoAccount, Lendable
 from library.views import IndexView
 
+from .constants import lendable_choices
 from .models import EmailLog
 from .views import email_users
 
@@ -90,6 +94,18 @@ class SendMailTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, '/admin/login/?next=/mail/send')
 
+    def test_lendable_choices(self):
+        """Test lendables are offered with the number checked out."""
+        Lendable.all_types.bulk_create([
+            Lendable(type='amazondemoaccount', user=self.user,
+                     due_on=timezone.now() + timedelta(days=1))
+        ])
+        self.assertIn(
+            ('amazondemoaccount',
+             '%s (1 checked out)' % AmazonDemoAccount.name),
+            lendable_choices()
+        )
+
     def test_send_mail(self):
         """Test the sending of emails to users."""
         self.user.is_staff = True
@@ -30,6 +30,7 @@ Requires:       python3-social-auth-app-django
 Requires:       python3-django-markdown-deux
 Requires:       python3-django-split-settings
 Requires:       python3-boto3
+Requires:       python3-cryptography
 Requires:       python3-Unidecode
 BuildRequires:  fdupes
 Recommends:     python3-coverage
@@ -68,6 +69,9 @@ project in a company independent way.
 %attr(0750, root, root) /usr/sbin/openbare-manage
 %attr(0750, root, root) /usr/sbin/openbare-user-monitor
 %config(noreplace) /etc/%{name}
+%dir %attr(0750, root, www) /var/lib/%{name}
+%dir %attr(2770, wwwrun, www) /var/lib/%{name}/ratelimit
+%dir %attr(2770, wwwrun, www) /var/cache/%{name}
 %{_mandir}/man*/*
 
 %changelog
@@ -15,7 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with openbare. If not, see <http://www.gnu.org/licenses/>.
 
-from django.core.checks import register, Warning
+from django.core.checks import register, Error, Warning
+from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
 
 @register()
@@ -40,3 +41,20 @@ def deprecated_settings(app_configs, **kwargs):
             )
         )
     return issues
+
+
+@register()
+def rate_limit_dir(app_configs, **kwargs):
+    from library import rate_limiter
+    try:
+        rate_limiter.shared_directory()
+    except ImproperlyConfigured as e:
+        return [
+            Error(
+                str(e),
+                hint="Create it writable by the web server and cron users.",
+                obj='settings.AWS_RATE_LIMIT_DIR',
+                id='openbare.E001'
+            )
+        ]
+    return []
@@ -0,0 +1,35 @@
+$(document).ready(function(){
+  // Load who has a resource checked out when its details are opened, a
+  // page at a time.
+  $(".modal").on("show.bs.modal", function(){
+    var table = $(this).find("[data-checked-out-url]");
+    if (!table.length || table.data("loaded")) {
+      return;
+    }
+    table.data("loaded", true);
+    var more = $(this).find(".checked-out-more");
+    var load = function(url){
+      more.hide();
+      $.getJSON(url, function(data){
+        var body = table.find("tbody");
+        $.each(data.items, function(i, item){
+          var row = $("<tr>");
+          row.append($("<td>").text(item.user));
+          row.append($("<td>").text(item.due_on));
+          row.append($("<td>").html(
+            item.renewable ? '<i class="fa fa-check"></i>' : ""
+          ));
+          body.append(row);
+        });
+        if (data.next) {
+          more.off("click").one("click", function(){
+            load(data.next);
+          }).show();
+        }
+      }).fail(function(){
+        table.data("loaded", false);
+      });
+    };
+    load(table.data("checked-out-url"));
+  });
+});
@@ -0,0 +1,32 @@
+$(document).ready(function(){
+  // Submit a checkout only once. The server answers a repeated submission
+  // with the outcome of the first one anyway.
+  $("form.checkout-form").submit(function(){
+    $(this).find("button[type=submit]").prop("disabled", true);
+  });
+
+  // Poll the status of lendables that are still being provisioned and
+  // offer to collect the credentials once they are ready, or tell why they
+  // failed.
+  $("[data-status-url]").each(function(){
+    var row = $(this);
+    var url = row.data("status-url");
+    var poll = function(){
+      $.getJSON(url, function(data){
+        if (data.state === "queued" || data.state === "provisioning") {
+          setTimeout(poll, 2000);
+        } else if (data.state === "failed") {
+          row.find("td:last").empty().append(
+            $("<span>").addClass("text-danger").text(data.message)
+          );
+        } else {
+          // The page offers the credentials once it is ready
+          window.location.reload();
+        }
+      }).fail(function(){
+        setTimeout(poll, 5000);
+      });
+    };
+    setTimeout(poll, 1000);
+  });
+});